@@ -0,0 +1,116 @@
+# backend/benchmarks/hot_queries.py
+"""Compare the hot request queries as per-request ``db.query(...)`` calls
+(before) and as the prebuilt statements in ``src/queries.py`` (after).
+
+For each query it prints the CPU time per execution and the SQL compile
+cache hit rate. It runs against in-memory SQLite so no services are needed;
+the numbers cover statement construction and compilation overhead, not
+database latency.
+
+Both ``cart_items`` variants joinedload the products so that row isolates
+statement reuse. ``cart_items_lazy`` (before only) is the handler's previous
+form with one lazy load per item; compare it with the ``cart_items`` after
+row for the effect of loading products in one query:
+
+    cd backend && python -m benchmarks.hot_queries [iterations]
+"""
+import os
+import sys
+import time
+import warnings
+from collections import Counter
+
+# Settings are required at import time; nothing connects to these
+for name, value in {
+    "DB_USER": "bench", "DB_PASSWORD": "bench", "DB_NAME": "bench", "DB_HOST": "localhost",
+    "DB_PORT": "5432", "JWT_SECRET_KEY": "bench", "API_KEY": "bench",
+    "REDIS_HOST": "localhost", "REDIS_PORT": "6379",
+}.items():
+    os.environ.setdefault(name, value)
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.pool import StaticPool
+
+from src.models.models import Cart, Inventory, Product, User
+from src.queries import CART_ITEM, CART_ITEMS, INVENTORY_FOR_UPDATE, LOCATION_STOCK, USER_BY_EMAIL
+
+# Query.get() is the legacy form being measured
+warnings.filterwarnings("ignore", message="The Query.get")
+
+LOCATION = "main"
+EMAIL = "baker@example.com"
+
+
+def _legacy(db, user_id):
+    # The handlers' previous forms
+    return {
+        "user_by_email": lambda: db.query(User).filter(User.email == EMAIL).first(),
+        "inventory_for_update": lambda: db.query(Inventory).with_for_update().get((LOCATION, 1)),
+        "location_stock": lambda: db.query(Inventory.product_id, Inventory.stock).filter(Inventory.location == LOCATION).all(),
+        "cart_item": lambda: db.query(Cart).filter(Cart.user_id == user_id, Cart.product_id == 1).first(),
+        "cart_items": lambda: [
+            item.product
+            for item in db.query(Cart).options(joinedload(Cart.product)).filter(Cart.user_id == user_id).all()
+        ],
+        # The handler's previous form: one lazy load per cart item
+        "cart_items_lazy": lambda: [item.product for item in db.query(Cart).filter(Cart.user_id == user_id).all()],
+    }
+
+
+def _prebuilt(db, user_id):
+    return {
+        "user_by_email": lambda: db.execute(USER_BY_EMAIL, {"email": EMAIL}).scalars().first(),
+        "inventory_for_update": lambda: db.execute(INVENTORY_FOR_UPDATE, {"location": LOCATION, "product_id": 1}).scalars().first(),
+        "location_stock": lambda: db.execute(LOCATION_STOCK, {"location": LOCATION}).all(),
+        "cart_item": lambda: db.execute(CART_ITEM, {"user_id": user_id, "product_id": 1}).scalars().first(),
+        "cart_items": lambda: [item.product for item in db.execute(CART_ITEMS, {"user_id": user_id}).scalars().all()],
+    }
+
+
+def _seed(engine):
+    tables = [User.__table__, Product.__table__, Cart.__table__, Inventory.__table__]
+    User.metadata.create_all(engine, tables=tables)
+    with Session(engine) as db:
+        user = User(username="baker", email=EMAIL, password_hash="x", is_active=True)
+        db.add(user)
+        db.flush()
+        for product_id in range(1, 21):
+            db.add(Product(id=product_id, name=f"bread-{product_id}", price=2.5))
+            db.add(Inventory(location=LOCATION, product_id=product_id, stock=100))
+        for product_id in range(1, 6):
+            db.add(Cart(user_id=user.id, product_id=product_id, quantity=1))
+        db.commit()
+        return user.id
+
+
+def run(iterations):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    user_id = _seed(engine)
+
+    cache_stats = Counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _count_cache(conn, cursor, statement, parameters, context, executemany):
+        cache_stats[context.cache_hit.name] += 1
+
+    print(f"{'query':<22}{'variant':<10}{'us/exec (cpu)':>14}{'cache hit %':>13}")
+    for name in _legacy(None, user_id):
+        for variant, factory in (("before", _legacy), ("after", _prebuilt)):
+            with Session(engine) as db:
+                query = factory(db, user_id).get(name)
+                if query is None:
+                    continue
+                query()  # warm the compiled cache
+                cache_stats.clear()
+                started = time.process_time()
+                for _ in range(iterations):
+                    query()
+                    db.expunge_all()  # like a fresh request session
+                elapsed = time.process_time() - started
+            hit_rate = 100 * cache_stats["CACHE_HIT"] / max(1, sum(cache_stats.values()))
+            print(f"{name:<22}{variant:<10}{elapsed / iterations * 1e6:>14.1f}{hit_rate:>13.1f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,135 @@
+# backend/benchmarks/logging_overhead.py
+"""Log volume and request-thread logging cost: SQL echo on stdout (before)
+against the queued JSON pipeline in ``src/utils/logging_config.py`` (after).
+
+Each simulated request runs five queries against in-memory SQLite and logs
+one application record; every tenth request also logs an exception. Output
+goes to a byte-counting stream. CPU time is measured on the request thread
+only, so work done on the listener thread is not counted. A second table
+compares the stock ``QueueHandler`` with ``DeferredQueueHandler`` for a
+logged exception:
+
+    cd backend && python -m benchmarks.logging_overhead [requests]
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+# Settings are required at import time; nothing connects to these
+for name, value in {
+    "DB_USER": "bench", "DB_PASSWORD": "bench", "DB_NAME": "bench", "DB_HOST": "localhost",
+    "DB_PORT": "5432", "JWT_SECRET_KEY": "bench", "API_KEY": "bench",
+    "REDIS_HOST": "localhost", "REDIS_PORT": "6379",
+}.items():
+    os.environ.setdefault(name, value)
+
+from sqlalchemy import create_engine, text
+
+from src.config import settings
+from src.utils import logging_config
+
+logger = logging.getLogger("src.routes.api")
+
+
+class CountingStream:
+    def __init__(self):
+        self.bytes = 0
+        self.lines = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        self.lines += data.count("\n")
+
+    def flush(self):
+        pass
+
+
+def _request(conn, index):
+    for product_id in range(5):
+        conn.execute(text("SELECT :id AS product_id, 'bread' AS name"), {"id": product_id}).all()
+    logger.info("Order created for user %s", index, extra={"order_id": index, "location": "main"})
+    if index % 10 == 0:
+        try:
+            raise ValueError("insufficient stock")
+        except ValueError:
+            logger.exception("Order failed for user %s", index)
+
+
+def _run(requests, echo):
+    sink = CountingStream()
+    engine = create_engine("sqlite://", echo=echo)
+    if echo:
+        # create_engine(echo=True) attaches its own stdout handler; point it at the sink
+        for handler in logging.getLogger("sqlalchemy.engine.Engine").handlers:
+            handler.setStream(sink)
+    else:
+        logging_config._listener.handlers[0].setStream(sink)
+    with engine.connect() as conn:
+        started = time.thread_time()
+        for index in range(requests):
+            _request(conn, index)
+        elapsed = time.thread_time() - started
+    engine.dispose()
+    return sink, elapsed
+
+
+def _reset():
+    logging_config.stop_logging()
+    for name in ("sqlalchemy.engine", "sqlalchemy.engine.Engine"):
+        engine_logger = logging.getLogger(name)
+        engine_logger.handlers.clear()
+        engine_logger.setLevel(logging.NOTSET)
+    logging.getLogger("sqlalchemy").setLevel(logging.WARNING)
+
+
+def run(requests):
+    results = []
+
+    # Before: SQL echoed synchronously, application records on a plain stream handler
+    _reset()
+    app_logger = logging.getLogger("src")
+    app_logger.addHandler(logging.StreamHandler(CountingStream()))
+    app_logger.setLevel(logging.INFO)
+    sink, elapsed = _run(requests, echo=True)
+    sink.bytes += app_logger.handlers[0].stream.bytes
+    sink.lines += app_logger.handlers[0].stream.lines
+    results.append(("echo (before)", sink, elapsed))
+
+    for label, levels in (("queued, default", ""), ("queued, SQL opted in", "sqlalchemy.engine=INFO")):
+        _reset()
+        app_logger.handlers.clear()
+        app_logger.setLevel(logging.NOTSET)
+        settings.LOG_LEVELS = levels
+        logging_config.setup_logging()
+        sink, elapsed = _run(requests, echo=False)
+        logging_config.stop_logging()  # drain the queue into the sink
+        results.append((label, sink, elapsed))
+
+    print(f"{'variant':<24}{'lines/req':>11}{'bytes/req':>11}{'us/req (cpu)':>14}")
+    for label, sink, elapsed in results:
+        print(f"{label:<24}{sink.lines / requests:>11.1f}{sink.bytes / requests:>11.0f}{elapsed / requests * 1e6:>14.1f}")
+
+
+def run_exceptions(iterations):
+    print(f"\n{'queue handler':<24}{'us/exception (cpu)':>20}")
+    for handler_class in (logging.handlers.QueueHandler, logging_config.DeferredQueueHandler):
+        exc_logger = logging.getLogger(f"bench.{handler_class.__name__}")
+        exc_logger.handlers[:] = [handler_class(queue.SimpleQueue())]
+        exc_logger.propagate = False
+        started = time.thread_time()
+        for index in range(iterations):
+            try:
+                raise ValueError("insufficient stock")
+            except ValueError:
+                exc_logger.exception("Order failed for user %s", index)
+        elapsed = time.thread_time() - started
+        print(f"{handler_class.__name__:<24}{elapsed / iterations * 1e6:>20.1f}")
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    run(iterations)
+    run_exceptions(iterations)
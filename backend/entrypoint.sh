@@ -0,0 +1,12 @@
+#!/bin/sh
+# Migrate the primary database and every location shard, make sure upcoming
+# orders partitions exist, then prefork workers (see gunicorn.conf.py).
+set -e
+
+alembic -c src/alembic.ini upgrade head
+for location in $(python -c "from src.database import LOCATION_SHARDS; print(' '.join(l for l, url in LOCATION_SHARDS.items() if url))"); do
+    alembic -c src/alembic.ini -x location="$location" upgrade head
+done
+python -m src.utils.order_partitions --skip-archive
+
+exec gunicorn src.app:app
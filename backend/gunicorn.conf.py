@@ -0,0 +1,31 @@
+# backend/gunicorn.conf.py
+# Production server settings, picked up automatically by `gunicorn src.app:app`
+import os
+
+def _available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", _available_cores()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app once in the master so workers fork with modules already loaded
+preload_app = True
+
+graceful_timeout = 30
+keepalive = 5
+
+def post_fork(server, worker):
+    # Sockets must never be shared across processes: discard anything the
+    # master may have opened so each worker connects lazily on first use.
+    from src.database import reset_engine_after_fork
+    from src.utils.redis_cache import reset_redis_client
+    from src.utils.logging_config import setup_logging
+
+    reset_engine_after_fork()
+    reset_redis_client()
+    # The master's log listener thread is not inherited; start one per worker
+    setup_logging()
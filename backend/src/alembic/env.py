@@ -9,7 +9,7 @@ sys.path.append(str(Path(__file__).parent.parent.parent))
 
 # Import your SQLAlchemy Base and models
 from src.models.models import Base
-from src.database import DATABASE_URL
+from src.database import DATABASE_URL, LOCATION_SHARDS
 
 # This is the Alembic Config object, which provides access to the values within alembic.ini
 config = context.config
@@ -20,6 +20,12 @@ fileConfig(config.config_file_name)
 # Set target_metadata to your SQLAlchemy Base.metadata
 target_metadata = Base.metadata
 
+# Every shard runs the same migrations: `alembic -x location=<location> upgrade head`
+# targets that location's database instead of the primary one.
+_location = context.get_x_argument(as_dictionary=True).get("location")
+if _location:
+    DATABASE_URL = LOCATION_SHARDS[_location] or DATABASE_URL
+
 def run_migrations_offline():
     url = DATABASE_URL
     context.configure(
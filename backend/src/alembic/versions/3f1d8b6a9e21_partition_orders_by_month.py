@@ -0,0 +1,106 @@
+"""Partition orders by month
+
+Revision ID: 3f1d8b6a9e21
+Revises: 9c4e7a1f2b3d
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1d8b6a9e21'
+down_revision: Union[str, None] = '9c4e7a1f2b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Partitions created up front beyond the current month; the maintenance job
+# (src/utils/order_partitions.py) keeps extending this window. orders_default
+# catches inserts for any month it has not reached, so they never fail.
+MONTHS_AHEAD = 3
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The partition key must be set on every row and be part of the primary key
+    op.execute("UPDATE orders SET created_at = now() WHERE created_at IS NULL")
+
+    op.execute("ALTER TABLE orders RENAME TO orders_legacy")
+    op.execute("ALTER TABLE orders_legacy RENAME CONSTRAINT orders_pkey TO orders_legacy_pkey")
+    op.execute("ALTER INDEX ix_orders_id RENAME TO ix_orders_legacy_id")
+
+    op.execute("""
+        CREATE TABLE orders (
+            id INTEGER NOT NULL DEFAULT nextval('orders_id_seq'),
+            product_id INTEGER NOT NULL REFERENCES products (id),
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            quantity INTEGER NOT NULL,
+            status VARCHAR(20),
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            CONSTRAINT orders_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.create_index(op.f('ix_orders_id'), 'orders', ['id'], unique=False)
+    op.create_index('ix_orders_user_id_created_at', 'orders', ['user_id', 'created_at'], unique=False)
+
+    # One partition per month from the oldest order through MONTHS_AHEAD from now
+    op.execute(f"""
+        DO $$
+        DECLARE
+            month_start date;
+        BEGIN
+            FOR month_start IN
+                SELECT generate_series(
+                    date_trunc('month', COALESCE((SELECT min(created_at) FROM orders_legacy), now())),
+                    date_trunc('month', now()) + interval '{MONTHS_AHEAD} months',
+                    interval '1 month'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF orders FOR VALUES FROM (%L) TO (%L)',
+                    'orders_' || to_char(month_start, 'YYYY_MM'),
+                    month_start,
+                    (month_start + interval '1 month')::date
+                );
+            END LOOP;
+        END $$
+    """)
+    op.execute("CREATE TABLE orders_default PARTITION OF orders DEFAULT")
+
+    op.execute("""
+        INSERT INTO orders (id, product_id, user_id, quantity, status, created_at)
+        SELECT id, product_id, user_id, quantity, status, created_at FROM orders_legacy
+    """)
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    op.drop_table('orders_legacy')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE orders RENAME TO orders_partitioned")
+    op.execute("ALTER TABLE orders_partitioned RENAME CONSTRAINT orders_pkey TO orders_partitioned_pkey")
+    op.execute("ALTER INDEX ix_orders_id RENAME TO ix_orders_partitioned_id")
+
+    op.create_table('orders',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('orders_id_seq')"), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id', name='orders_pkey')
+    )
+    op.create_index(op.f('ix_orders_id'), 'orders', ['id'], unique=False)
+    op.execute("""
+        INSERT INTO orders (id, product_id, user_id, quantity, status, created_at)
+        SELECT id, product_id, user_id, quantity, status, created_at FROM orders_partitioned
+    """)
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    # Dropping the parent drops every attached partition with it
+    op.drop_table('orders_partitioned')
@@ -0,0 +1,30 @@
+"""Add partial index on pending orders
+
+Revision ID: 5d7e1a3c9f42
+Revises: e4a9c2d7f1b6
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d7e1a3c9f42'
+down_revision: Union[str, None] = 'e4a9c2d7f1b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Created on the partitioned table, so every partition (and future ones) gets it
+    op.create_index('ix_orders_pending_created_at', 'orders', ['created_at'], unique=False,
+                    postgresql_where=sa.text("status = 'pending'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_orders_pending_created_at', table_name='orders')
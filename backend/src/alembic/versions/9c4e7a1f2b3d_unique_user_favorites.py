@@ -0,0 +1,33 @@
+"""Unique user favorites
+
+Revision ID: 9c4e7a1f2b3d
+Revises: 6be303d12967
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4e7a1f2b3d'
+down_revision: Union[str, None] = '6be303d12967'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Drop duplicate rows so the constraint can be created
+    op.execute(
+        "DELETE FROM user_favorites a USING user_favorites b "
+        "WHERE a.ctid < b.ctid AND a.user_id = b.user_id AND a.product_id = b.product_id"
+    )
+    op.create_unique_constraint('_user_favorite_uc', 'user_favorites', ['user_id', 'product_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('_user_favorite_uc', 'user_favorites', type_='unique')
@@ -0,0 +1,67 @@
+"""Add locations and per-location inventory
+
+Revision ID: b8d3f0c6a5e7
+Revises: 7a2c5e9d4b10
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from src.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d3f0c6a5e7'
+down_revision: Union[str, None] = '7a2c5e9d4b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('inventory',
+    sa.Column('location', sa.String(length=32), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('stock', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('location', 'product_id')
+    )
+    # Existing stock belongs to the original (default) location
+    op.execute(
+        sa.text("INSERT INTO inventory (location, product_id, stock) SELECT :location, id, stock FROM products")
+        .bindparams(location=settings.DEFAULT_LOCATION)
+    )
+    op.drop_column('products', 'stock')
+
+    op.add_column('orders', sa.Column('location', sa.String(length=32), nullable=False,
+                                      server_default=settings.DEFAULT_LOCATION))
+    op.alter_column('orders', 'location', server_default=None)
+    op.add_column('baking_batches', sa.Column('location', sa.String(length=32), nullable=False,
+                                              server_default=settings.DEFAULT_LOCATION))
+    op.alter_column('baking_batches', 'location', server_default=None)
+
+    # Shard data refers to the global catalog and users by id only. Each shard
+    # also has its own id sequences; e4a9c2d7f1b6 offsets them per shard.
+    op.drop_constraint('orders_product_id_fkey', 'orders', type_='foreignkey')
+    op.drop_constraint('orders_user_id_fkey', 'orders', type_='foreignkey')
+    op.drop_constraint('baking_batches_product_id_fkey', 'baking_batches', type_='foreignkey')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_foreign_key('baking_batches_product_id_fkey', 'baking_batches', 'products', ['product_id'], ['id'])
+    op.create_foreign_key('orders_user_id_fkey', 'orders', 'users', ['user_id'], ['id'])
+    op.create_foreign_key('orders_product_id_fkey', 'orders', 'products', ['product_id'], ['id'])
+    op.drop_column('baking_batches', 'location')
+    op.drop_column('orders', 'location')
+
+    op.add_column('products', sa.Column('stock', sa.Integer(), nullable=False, server_default='0'))
+    op.alter_column('products', 'stock', server_default=None)
+    op.execute(
+        sa.text("UPDATE products SET stock = inventory.stock FROM inventory "
+                "WHERE inventory.product_id = products.id AND inventory.location = :location")
+        .bindparams(location=settings.DEFAULT_LOCATION)
+    )
+    op.drop_table('inventory')
@@ -0,0 +1,49 @@
+"""Offset order and batch id sequences per shard
+
+Revision ID: e4a9c2d7f1b6
+Revises: b8d3f0c6a5e7
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+
+from src.config import settings
+from src.database import shard_number
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a9c2d7f1b6'
+down_revision: Union[str, None] = 'b8d3f0c6a5e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Every shard database runs this chain with its own orders / baking_batches
+# sequences. Stepping them by SHARD_ID_STRIDE from a per-database offset
+# keeps ids unique across locations from here on; ids issued before this
+# revision may still repeat between shards.
+SEQUENCES = {'orders_id_seq': 'orders', 'baking_batches_id_seq': 'baking_batches'}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    location = context.get_x_argument(as_dictionary=True).get("location", settings.DEFAULT_LOCATION)
+    stride, offset = settings.SHARD_ID_STRIDE, shard_number(location)
+    if offset >= stride:
+        raise RuntimeError(f"Shard {offset} for '{location}' does not fit SHARD_ID_STRIDE={stride}")
+    for sequence, table in SEQUENCES.items():
+        op.execute(f"ALTER SEQUENCE {sequence} INCREMENT BY {stride}")
+        # Next id: the first value above everything issued so far that falls on this shard's offset
+        op.execute(f"""
+            SELECT setval('{sequence}',
+                          (GREATEST((SELECT COALESCE(max(id), 0) FROM {table}),
+                                    (SELECT last_value FROM {sequence})) / {stride} + 1) * {stride} + {offset},
+                          false)
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for sequence in SEQUENCES:
+        op.execute(f"ALTER SEQUENCE {sequence} INCREMENT BY 1")
@@ -1,15 +1,27 @@
 # backend/src/app.py
+import time
+
+# Captured at import; with a preloading server this is the master's boot time
+BOOT_STARTED = time.time()
+
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from typing import Literal, Optional
+from fastapi import Depends, FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from src.database import engine, check_db_connection, Base
-from src.routes.api import router
+from pydantic import BaseModel, Field
+from src.database import check_schema_head
+from src.routes.api import router, admin_required
+from src.utils.favorites import FavoritesFlusher, rebuild_favorites_if_needed
+from src.utils.logging_config import setup_logging, RequestIdMiddleware
+from src.utils.rate_limit import RateLimitMiddleware
+from src.utils.idempotency import IdempotencyMiddleware
+from src.utils.profiler import profiler, ProfilingMiddleware
 import logging
 from concurrent.futures import ThreadPoolExecutor
 import asyncio
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Set up logging (JSON records written by a background listener thread)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Create a thread pool executor
@@ -21,20 +33,52 @@ async def lifespan(app: FastAPI):
     logger.info("Starting up the application...")
     loop = asyncio.get_event_loop()
     try:
-        await loop.run_in_executor(executor, check_db_connection)
-        # Create all tables defined in models
-        Base.metadata.create_all(bind=engine)
-        logger.info("Database schema initialized successfully")
+        # Schema changes are applied by 'alembic upgrade head' at deploy time;
+        # workers only confirm the database is at the expected revision.
+        await loop.run_in_executor(executor, check_schema_head)
+        logger.info("Database schema is at Alembic head")
     except Exception as e:
-        logger.error(f"Database connection or schema initialization failed: {e}")
+        logger.error(f"Database connection or schema check failed: {e}")
         raise
+    try:
+        # Only the first worker to see a cold Redis does any work here
+        await loop.run_in_executor(executor, rebuild_favorites_if_needed)
+    except Exception as e:
+        logger.error(f"Favorites cache rebuild failed: {e}")
+    favorites_flusher = FavoritesFlusher()
+    favorites_flusher.start()
+    # Started per worker: threads do not survive the fork from a preloading master
+    profiler.start()
+    logger.info(f"Worker ready {(time.time() - BOOT_STARTED) * 1000:.0f} ms after boot")
 
     yield  # Application runs here
 
     # Shutdown logic
     logger.info("Shutting down the application...")
+    favorites_flusher.stop()
+    profiler.stop()
     executor.shutdown()
 
+class ColdStartTimer:
+    """ASGI wrapper that logs how long after boot the first response went out."""
+
+    def __init__(self, app):
+        self.app = app
+        self.pending = True
+
+    async def __call__(self, scope, receive, send):
+        if not self.pending or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.pending = False
+
+        async def timed_send(message):
+            await send(message)
+            if message["type"] == "http.response.start":
+                logger.info(f"First request served {(time.time() - BOOT_STARTED) * 1000:.0f} ms after boot")
+
+        await self.app(scope, receive, timed_send)
+
 # Initialize FastAPI app with lifespan handler (only once)
 app = FastAPI(lifespan=lifespan)
 
@@ -43,6 +87,9 @@ origins = [
     "http://localhost:5173"
 ]
 
+# Added first so they run inside CORS and rejections still carry CORS headers
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -50,9 +97,40 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(RequestIdMiddleware)
+app.add_middleware(ColdStartTimer)
 
 app.include_router(router, prefix="/api")
 
+# Admin-only profiling surface. The configuration and the captures are shared
+# through Redis, so any worker can serve these; each worker samples itself.
+class ProfilerConfig(BaseModel):
+    duration_s: float = Field(0.0, ge=0, le=600, description="Open a sampling window in every worker")
+    request_fraction: Optional[float] = Field(None, ge=0, le=1, description="Profile this share of requests")
+    slow_request_ms: Optional[float] = Field(None, ge=0, description="Capture requests slower than this (0 disables)")
+
+@app.get("/api/admin/profiler", tags=["admin"], dependencies=[Depends(admin_required)])
+def get_profiler_status() -> dict:
+    return profiler.status()
+
+@app.post("/api/admin/profiler", tags=["admin"], dependencies=[Depends(admin_required)])
+def configure_profiler(config: ProfilerConfig) -> dict:
+    profiler.configure(config.duration_s, config.request_fraction, config.slow_request_ms)
+    return profiler.status()
+
+@app.get("/api/admin/profiler/captures/{capture_id}", tags=["admin"], dependencies=[Depends(admin_required)])
+def download_capture(capture_id: str, format: Literal["speedscope", "collapsed"] = "speedscope") -> Response:
+    capture = profiler.get_capture(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Capture not found (it may have been evicted)")
+    if format == "collapsed":
+        content, media_type, filename = profiler.to_collapsed(capture), "text/plain", f"capture-{capture_id}.folded"
+    else:
+        content, media_type, filename = profiler.to_speedscope(capture), "application/json", f"capture-{capture_id}.speedscope.json"
+    return Response(content, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 if __name__ == "__main__":
+    # Development server only; production runs gunicorn with gunicorn.conf.py
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("src.app:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -1,4 +1,10 @@
-from sqlalchemy import create_engine
+import json
+import math
+import threading
+import time
+from pathlib import Path
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.orm import DeclarativeBase  # Add this import
 from src.config import settings
@@ -10,20 +16,113 @@ class Base(DeclarativeBase):
 
 # URL-encode the password
 encoded_password = quote_plus(settings.DB_PASSWORD)
-DATABASE_URL = f"postgresql+psycopg2://{settings.DB_USER}:{encoded_password}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
-print(f"Database URL: {DATABASE_URL}")  # For debugging
-
-# Create a synchronous engine
-engine = create_engine(
-    DATABASE_URL,
-    echo=True,
-    pool_size=5,
-    max_overflow=10
-)
-
-# Create a session factory for synchronous sessions
+DATABASE_URL = f"postgresql+{settings.DB_DRIVER}://{settings.DB_USER}:{encoded_password}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
+
+ALEMBIC_SCRIPT_LOCATION = Path(__file__).parent / "alembic"
+
+def _create_engine(url):
+    connect_args = {}
+    if make_url(url).get_driver_name() == "psycopg":
+        # psycopg 3 prepares a statement server-side once it has run this many
+        # times on a connection; psycopg2 has no equivalent
+        connect_args["prepare_threshold"] = settings.DB_PREPARE_THRESHOLD
+    return create_engine(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        connect_args=connect_args
+    )
+
+# Create a synchronous engine (no connection is opened until first use,
+# so it is safe to build this in a preloading master before forking)
+engine = _create_engine(DATABASE_URL)
+
+# Create a session factory for synchronous sessions (users, catalog, carts)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Shard router: location -> database URL ("" means the primary database)
+LOCATION_SHARDS = {settings.DEFAULT_LOCATION: "", **json.loads(settings.SHARD_URLS)}
+
+# Engines and session factories per shard URL, created on first use in each
+# worker. Locations that share a URL share one pool. The first requests to a
+# shard arrive concurrently from the threadpool, hence the lock.
+_shard_engines = {}
+_shard_sessions = {}
+_shard_lock = threading.Lock()
+
+def get_shard_engine(location: str):
+    """Return the engine holding ``location``'s inventory and orders; KeyError if unknown."""
+    url = LOCATION_SHARDS[location]
+    if not url:
+        return engine
+    if url not in _shard_engines:
+        with _shard_lock:
+            if url not in _shard_engines:
+                _shard_engines[url] = _create_engine(url)
+    return _shard_engines[url]
+
+def get_shard_session(location: str) -> Session:
+    url = LOCATION_SHARDS[location]
+    if not url:
+        return SessionLocal()
+    if url not in _shard_sessions:
+        shard_engine = get_shard_engine(location)
+        with _shard_lock:
+            if url not in _shard_sessions:
+                factory = sessionmaker(autocommit=False, autoflush=False, bind=shard_engine)
+                _track_pool_wait(factory)
+                _shard_sessions[url] = factory
+    return _shard_sessions[url]()
+
+def shard_number(location: str) -> int:
+    """Position of ``location``'s database: 0 for the primary, then distinct shard URLs in order."""
+    urls = [""]
+    for url in LOCATION_SHARDS.values():
+        if url not in urls:
+            urls.append(url)
+    return urls.index(LOCATION_SHARDS[location])
+
+def all_engines():
+    # The primary database first, then each distinct shard database
+    engines = [engine]
+    for location in LOCATION_SHARDS:
+        shard_engine = get_shard_engine(location)
+        if shard_engine not in engines:
+            engines.append(shard_engine)
+    return engines
+
+# Recent time sessions spent waiting for a pooled connection, as an EWMA that
+# decays towards zero while no new samples arrive (e.g. while shedding load)
+POOL_WAIT_HALF_LIFE_S = 1.0
+_pool_wait = {"ms": 0.0, "at": time.monotonic()}
+
+def _decayed_pool_wait(now):
+    elapsed = now - _pool_wait["at"]
+    return _pool_wait["ms"] * math.pow(0.5, elapsed / POOL_WAIT_HALF_LIFE_S)
+
+def db_pool_wait_ms():
+    return _decayed_pool_wait(time.monotonic())
+
+def _mark_checkout_start(session, transaction):
+    if transaction.parent is None:
+        session.info["checkout_started"] = time.monotonic()
+
+def _record_pool_wait(session, transaction, connection):
+    started = session.info.pop("checkout_started", None)
+    if started is None:
+        return
+    now = time.monotonic()
+    sample = (now - started) * 1000
+    _pool_wait["ms"] = 0.8 * _decayed_pool_wait(now) + 0.2 * sample
+    _pool_wait["at"] = now
+
+def _track_pool_wait(factory):
+    event.listen(factory, "after_transaction_create", _mark_checkout_start)
+    event.listen(factory, "after_begin", _record_pool_wait)
+
+_track_pool_wait(SessionLocal)
+
 # Dependency to provide a synchronous database session
 def get_db():
     db = SessionLocal()
@@ -32,7 +131,41 @@ def get_db():
     finally:
         db.close()
 
+def shard_db(location: str):
+    # Generator counterpart of get_db for a location's shard
+    db = get_shard_session(location)
+    try:
+        yield db
+    finally:
+        db.close()
+
 def check_db_connection():
     # Synchronous function to check the database connection
     with engine.connect() as conn:
-        pass  # If this succeeds, the connection is established
\ No newline at end of file
+        pass  # If this succeeds, the connection is established
+
+def check_schema_head():
+    """Verify the database is at the Alembic head without mutating the schema.
+
+    Migrations are applied once by the deploy step (``alembic upgrade head``),
+    so workers only compare revisions instead of racing on ``create_all``.
+    """
+    from alembic.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    expected = set(ScriptDirectory(str(ALEMBIC_SCRIPT_LOCATION)).get_heads())
+    for db_engine in all_engines():
+        with db_engine.connect() as conn:
+            current = set(MigrationContext.configure(conn).get_current_heads())
+        if current != expected:
+            raise RuntimeError(
+                f"Database {db_engine.url.render_as_string(hide_password=True)} is at "
+                f"{sorted(current) or 'no revision'}, expected {sorted(expected)}; run 'alembic upgrade head'"
+            )
+
+def reset_engine_after_fork():
+    # Drop pooled connections inherited from the parent process without
+    # closing them, so the parent's sockets are left untouched.
+    engine.dispose(close=False)
+    for shard_engine in _shard_engines.values():
+        shard_engine.dispose(close=False)
\ No newline at end of file
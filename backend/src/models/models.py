@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Table, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Table, UniqueConstraint, Index, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from src.database import Base
@@ -7,7 +8,9 @@ from src.database import Base
 user_favorites = Table(
     'user_favorites', Base.metadata,
     Column('user_id', Integer, ForeignKey('users.id')),
-    Column('product_id', Integer, ForeignKey('products.id'))
+    Column('product_id', Integer, ForeignKey('products.id')),
+    # Lets the favorites flusher upsert with ON CONFLICT DO NOTHING
+    UniqueConstraint('user_id', 'product_id', name='_user_favorite_uc')
 )
 
 
@@ -40,8 +43,7 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     cart = relationship("Cart", back_populates="user", cascade="all, delete-orphan")
 
-    # Relationships
-    orders = relationship("Order", back_populates="user")
+    # Relationships (orders live in per-location shards, so there is no User.orders)
     favorites = relationship(
         "Product",
         secondary=user_favorites,
@@ -55,11 +57,9 @@ class Product(Base):
     name = Column(String(100), unique=True, nullable=False)
     price = Column(Float, nullable=False)
     description = Column(String, nullable=True)
-    stock = Column(Integer, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-    # Relationships
-    orders = relationship("Order", back_populates="product")
+    # Relationships (stock and orders are per location, see Inventory and Order)
     favorited_by = relationship(
         "User",
         secondary=user_favorites,
@@ -68,16 +68,44 @@ class Product(Base):
 
     cart = relationship("Cart", back_populates="product")
 
-# Order Model
+# Inventory Model: stock of a catalog product at one location, stored in that location's shard
+class Inventory(Base):
+    __tablename__ = "inventory"
+    location = Column(String(32), primary_key=True)
+    # Refers to products.id in the primary database, so it cannot be a foreign key
+    product_id = Column(Integer, primary_key=True)
+    stock = Column(Integer, nullable=False)
+
+# Order Model: stored in the shard of its location
 class Order(Base):
     __tablename__ = "orders"
     id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    # Catalog and users are global, so these are plain ids rather than foreign keys
+    product_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    location = Column(String(32), nullable=False)
     quantity = Column(Integer, nullable=False)
     status = Column(String(20), default='pending')
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Partition key: monthly range partitions (see src/utils/order_partitions.py).
+    # The table's primary key is (id, created_at); id alone stays unique via its sequence.
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
-    # Relationships
-    product = relationship("Product", back_populates="orders")
-    user = relationship("User", back_populates="orders")
\ No newline at end of file
+    __table_args__ = (
+        Index('ix_orders_user_id_created_at', 'user_id', 'created_at'),
+        # Only pending orders, for the fulfillment worker's sweep
+        Index('ix_orders_pending_created_at', 'created_at', postgresql_where=text("status = 'pending'")),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+# Baking Batch Model: orders for one product that are baked and handed over together,
+# stored in the shard of its location next to those orders
+class BakingBatch(Base):
+    __tablename__ = "baking_batches"
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, nullable=False)
+    location = Column(String(32), nullable=False)
+    # Orders are partitioned, so batch membership is kept here rather than as a foreign key on orders
+    order_ids = Column(ARRAY(Integer), nullable=False)
+    status = Column(String(20), nullable=False, default='baking')
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
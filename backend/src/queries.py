@@ -0,0 +1,36 @@
+# backend/src/queries.py
+"""Prebuilt statements for the queries every request runs.
+
+They are built once at import with ``bindparam`` placeholders instead of
+being rebuilt through ``db.query(...)`` in each handler. SQLAlchemy
+memoizes the cache key on the statement object, so each execution skips
+query construction and cache key generation and goes straight to the
+engine's compiled cache. Run them with ``db.execute(STATEMENT, {...})``.
+"""
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import joinedload
+
+from src.models.models import Cart, Inventory, User
+
+# get_current_user / login
+USER_BY_EMAIL = select(User).where(User.email == bindparam("email")).limit(1)
+
+# create_order: lock the location's stock row
+INVENTORY_FOR_UPDATE = (
+    select(Inventory)
+    .where(Inventory.location == bindparam("location"), Inventory.product_id == bindparam("product_id"))
+    .with_for_update()
+)
+
+# Stock of every product at one location
+LOCATION_STOCK = select(Inventory.product_id, Inventory.stock).where(Inventory.location == bindparam("location"))
+
+# add_to_cart
+CART_ITEM = (
+    select(Cart)
+    .where(Cart.user_id == bindparam("user_id"), Cart.product_id == bindparam("product_id"))
+    .limit(1)
+)
+
+# get_cart: products are loaded in the same query instead of one lazy load per item
+CART_ITEMS = select(Cart).where(Cart.user_id == bindparam("user_id")).options(joinedload(Cart.product))
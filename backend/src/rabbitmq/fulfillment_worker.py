@@ -0,0 +1,121 @@
+# backend/src/rabbitmq/fulfillment_worker.py
+
+import json
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+import pika
+from sqlalchemy import select
+from .rabbitmq_config import get_rabbitmq_parameters
+from src.config import settings
+from src.database import LOCATION_SHARDS, get_shard_session
+from src.models.models import Order
+from src.utils.fulfillment import create_baking_batches
+
+logger = logging.getLogger(__name__)
+
+ORDER_EVENTS_QUEUE = "order_events"
+
+def _parse_order_event(body):
+    """Return (location, order_id, product_id) for an order_created event, else None."""
+    try:
+        event = json.loads(body)
+        if event.get("event") != "order_created":
+            return None
+        location = event.get("location", settings.DEFAULT_LOCATION)
+        if location not in LOCATION_SHARDS:
+            return None
+        return location, int(event["order_id"]), int(event["product_id"])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+def process_window(channel, deliveries):
+    """Turn one window of order events into baking batches and ack them together."""
+    orders_by_location = defaultdict(list)
+    for method, body in deliveries:
+        parsed = _parse_order_event(body)
+        if parsed is None:
+            logger.warning("Skipping unrecognised order event", extra={"body": body.decode(errors="replace")})
+        else:
+            location, order_id, product_id = parsed
+            orders_by_location[location].append((order_id, product_id))
+
+    # Each location's orders and batches live in its own shard
+    for location, orders in orders_by_location.items():
+        with get_shard_session(location) as db:
+            batches = create_baking_batches(db, location, orders)
+            db.commit()
+            for batch in batches:
+                logger.info("Started baking batch", extra={"batch_id": batch.id, "location": location,
+                                                          "product_id": batch.product_id, "orders": len(batch.order_ids)})
+    # Only acknowledge once the batch is committed; a crash before this redelivers the window
+    channel.basic_ack(delivery_tag=deliveries[-1][0].delivery_tag, multiple=True)
+
+def sweep_pending_orders():
+    """Batch pending orders whose order_created event never arrived.
+
+    The API commits an order before publishing its event and only logs a
+    failed publish, so without this those orders would stay pending.
+    create_baking_batches skips anything no longer pending, so a late
+    event for a swept order is harmless.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.FULFILLMENT_SWEEP_INTERVAL_SECONDS)
+    for location in LOCATION_SHARDS:
+        with get_shard_session(location) as db:
+            orders = db.execute(
+                select(Order.id, Order.product_id)
+                .where(Order.status == "pending", Order.created_at < cutoff, Order.location == location)
+                .order_by(Order.created_at)
+                .limit(settings.FULFILLMENT_MAX_BATCH)
+            ).all()
+            if not orders:
+                continue
+            batches = create_baking_batches(db, location, [(order_id, product_id) for order_id, product_id in orders])
+            db.commit()
+            logger.warning("Batched pending orders without an event", extra={
+                "location": location, "orders": len(orders), "batches": [batch.id for batch in batches]})
+
+def start_fulfillment():
+    """Consume order events and start a baking batch per product every window.
+
+    Every FULFILLMENT_SWEEP_INTERVAL_SECONDS it also sweeps up pending orders
+    whose event was lost.
+    """
+    try:
+        parameters = get_rabbitmq_parameters()
+        connection = pika.BlockingConnection(parameters)
+        channel = connection.channel()
+
+        channel.queue_declare(queue=ORDER_EVENTS_QUEUE, durable=True)
+        channel.basic_qos(prefetch_count=settings.FULFILLMENT_MAX_BATCH)
+
+        logger.info("Waiting for order events", extra={"queue": ORDER_EVENTS_QUEUE})
+        deliveries = []
+        window_ends = None
+        next_sweep = time.monotonic()
+        for method, properties, body in channel.consume(ORDER_EVENTS_QUEUE, inactivity_timeout=1.0):
+            if time.monotonic() >= next_sweep:
+                try:
+                    sweep_pending_orders()
+                except Exception as e:
+                    logger.error("Pending orders sweep failed", extra={"error": str(e)})
+                next_sweep = time.monotonic() + settings.FULFILLMENT_SWEEP_INTERVAL_SECONDS
+            if method is not None:
+                if not deliveries:
+                    window_ends = time.monotonic() + settings.FULFILLMENT_BATCH_WINDOW_SECONDS
+                deliveries.append((method, body))
+            if deliveries and (
+                len(deliveries) >= settings.FULFILLMENT_MAX_BATCH or time.monotonic() >= window_ends
+            ):
+                process_window(channel, deliveries)
+                deliveries = []
+    except pika.exceptions.AMQPConnectionError as e:
+        logger.error("Error connecting to RabbitMQ", extra={"queue": ORDER_EVENTS_QUEUE, "error": str(e)})
+    except ValueError as e:
+        logger.error("RabbitMQ configuration error", extra={"error": str(e)})
+
+if __name__ == '__main__':
+    from src.utils.logging_config import setup_logging
+    setup_logging()
+    start_fulfillment()
@@ -1,11 +1,14 @@
 # backend/src/rabbitmq/rabbitmq_consumer.py
 
+import logging
 import pika
 from .rabbitmq_config import get_rabbitmq_parameters
 
+logger = logging.getLogger(__name__)
+
 def callback(ch, method, properties, body):
     """Callback function to handle received messages."""
-    print(f" [x] Received {body.decode()} from {method.routing_key}")
+    logger.debug("Received message", extra={"routing_key": method.routing_key, "body": body.decode()})
     ch.basic_ack(delivery_tag=method.delivery_tag) # Acknowledge message
 
 def start_consuming(queue_name):
@@ -19,12 +22,14 @@ def start_consuming(queue_name):
         channel.basic_qos(prefetch_count=1) # Process one message at a time
         channel.basic_consume(queue=queue_name, on_message_callback=callback)
 
-        print(f" [*] Waiting for messages in {queue_name}. To exit press CTRL+C")
+        logger.info("Waiting for messages", extra={"queue": queue_name})
         channel.start_consuming()
     except pika.exceptions.AMQPConnectionError as e:
-        print(f"Error connecting to RabbitMQ: {e}")
+        logger.error("Error connecting to RabbitMQ", extra={"queue": queue_name, "error": str(e)})
     except ValueError as e:
-        print(f"Configuration Error: {e}")
+        logger.error("RabbitMQ configuration error", extra={"error": str(e)})
 
 if __name__ == '__main__':
+    from src.utils.logging_config import setup_logging
+    setup_logging()
     start_consuming("default_queue") # Consume from the default queue
\ No newline at end of file
@@ -3,19 +3,24 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 from decimal import Decimal
 import json
 
 from src.utils.redis_cache import get_cache, set_cache, delete_cache
-from src.models.models import Cart, User, Product, Order
+from src.utils.favorites import FavoritesUnavailable, add_favorite, remove_favorite, list_favorites, favorite_counts
+from src.utils.fulfillment import advance_batch
+from src.models.models import BakingBatch, Cart, Inventory, User, Product, Order
 from src.config import settings
-from src.database import get_db
+from src.database import LOCATION_SHARDS, get_db, shard_db
+from src.queries import USER_BY_EMAIL, INVENTORY_FOR_UPDATE, LOCATION_STOCK, CART_ITEM, CART_ITEMS
 from src.rabbitmq.rabbitmq_producer import publish_message
 from src.schemas import (
     CartItem, CartResponse, UserCreate, UserLogin, UserResponse,
-    ProductCreate, ProductResponse, OrderCreate, OrderResponse
+    ProductCreate, ProductResponse, OrderCreate, OrderResponse, InventoryUpdate,
+    FavoritesResponse, FavoriteCountResponse, BakingBatchResponse, BatchStatusUpdate
 )
 
 router = APIRouter()
@@ -42,7 +47,7 @@ def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=["HS256"])
         email: str = payload.get("sub")
-        user = db.query(User).filter(User.email == email).first()
+        user = db.execute(USER_BY_EMAIL, {"email": email}).scalars().first()
         if not user or not user.is_active:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         return user
@@ -54,6 +59,26 @@ def admin_required(current_user: User = Depends(get_current_user)) -> User:
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
+# Location (store) routing
+def get_location(request: Request) -> str:
+    location = request.headers.get("X-Location") or request.query_params.get("location") or settings.DEFAULT_LOCATION
+    if location not in LOCATION_SHARDS:
+        raise HTTPException(status_code=404, detail="Unknown location")
+    return location
+
+def get_location_db(location: str = Depends(get_location)):
+    # Session on the shard that holds this location's inventory and orders
+    yield from shard_db(location)
+
+def get_location_stock(location: str, shard: Session) -> dict[int, int]:
+    cache_key = f"stock:{location}"
+    cached_stock = get_cache(cache_key)
+    if cached_stock:
+        return {int(product_id): stock for product_id, stock in json.loads(cached_stock).items()}
+    stock = dict(shard.execute(LOCATION_STOCK, {"location": location}).all())
+    set_cache(cache_key, json.dumps(stock), expire_time=timedelta(minutes=5))
+    return stock
+
 # Auth endpoints
 @router.post("/register", response_model=dict, tags=["auth"])
 def register(user_data: UserCreate, db: Session = Depends(get_db)) -> dict:
@@ -81,7 +106,7 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)) -> dict:
 
 @router.post("/login", response_model=dict, tags=["auth"])
 def login(user_data: UserLogin, db: Session = Depends(get_db), response: Response = None) -> dict:
-    user = db.query(User).filter(User.email == user_data.email).first()
+    user = db.execute(USER_BY_EMAIL, {"email": user_data.email}).scalars().first()
     if not user or not verify_password(user_data.password, user.password_hash):
         raise HTTPException(status_code=400, detail="Invalid credentials")
     access_token = create_access_token(data={"sub": user.email})
@@ -124,74 +149,150 @@ def get_user(user_id: int, current_user: User = Depends(get_current_user), db: S
     return user_data
 
 @router.post("/products", response_model=dict, tags=["products"], dependencies=[Depends(admin_required)])
-def create_product(product_data: ProductCreate, db: Session = Depends(get_db)) -> dict:
+def create_product(product_data: ProductCreate, db: Session = Depends(get_db),
+                   location: str = Depends(get_location), shard: Session = Depends(get_location_db)) -> dict:
     existing_product = db.query(Product).filter(Product.name == product_data.name).first()
     if existing_product:
         raise HTTPException(status_code=400, detail="Product exists")
     new_product = Product(
         name=product_data.name,
         price=Decimal(str(product_data.price)),
-        description=product_data.description,
-        stock=product_data.stock
+        description=product_data.description
     )
     db.add(new_product)
     db.commit()
     db.refresh(new_product)
+    # The catalog entry is global; the initial stock belongs to the requesting location.
+    # The two databases commit separately, so undo the catalog row if the shard fails
+    # rather than leave a product without stock that a retry would reject as existing.
+    try:
+        shard.execute(
+            insert(Inventory)
+            .values(location=location, product_id=new_product.id, stock=product_data.stock)
+            .on_conflict_do_nothing(index_elements=["location", "product_id"])
+        )
+        shard.commit()
+    except Exception:
+        shard.rollback()
+        db.delete(new_product)
+        db.commit()
+        raise
     delete_cache("all_products")
+    delete_cache(f"stock:{location}")
     publish_message("product_events", f"New product created: {new_product.name}")
+    product_response = ProductResponse.from_orm(new_product)
+    product_response.stock = product_data.stock
     return {
         "message": "Product created",
-        "product": ProductResponse.from_orm(new_product).dict()
+        "product": product_response.dict()
     }
 
+@router.put("/inventory/{product_id}", response_model=dict, tags=["products"], dependencies=[Depends(admin_required)])
+def set_inventory(product_id: int, update: InventoryUpdate, db: Session = Depends(get_db),
+                  location: str = Depends(get_location), shard: Session = Depends(get_location_db)) -> dict:
+    if not db.query(Product.id).filter(Product.id == product_id).first():
+        raise HTTPException(status_code=404, detail="Product not found")
+    inventory = shard.query(Inventory).with_for_update().get((location, product_id))
+    if inventory:
+        inventory.stock = update.stock
+    else:
+        shard.add(Inventory(location=location, product_id=product_id, stock=update.stock))
+    shard.commit()
+    delete_cache(f"stock:{location}")
+    return {"message": "Inventory updated", "location": location, "product_id": product_id, "stock": update.stock}
+
 @router.get("/products", response_model=list[ProductResponse], tags=["products"])
-def get_products(db: Session = Depends(get_db)) -> list[ProductResponse]:
+def get_products(db: Session = Depends(get_db), location: str = Depends(get_location),
+                 shard: Session = Depends(get_location_db)) -> list[ProductResponse]:
     cached_products = get_cache("all_products")
     if cached_products:
-        return [ProductResponse.parse_raw(prod) for prod in json.loads(cached_products)]
-    products = db.query(Product).all()
-    products_serialized = [ProductResponse.from_orm(p).json() for p in products]
-    set_cache("all_products", json.dumps(products_serialized))
-    return [ProductResponse.from_orm(p) for p in products]
+        products = [ProductResponse.parse_raw(prod) for prod in json.loads(cached_products)]
+    else:
+        products = [ProductResponse.from_orm(p) for p in db.query(Product).all()]
+        set_cache("all_products", json.dumps([p.json() for p in products]))
+    # Stock and counts are per location / change constantly, so they are not cached with the catalog
+    stock = get_location_stock(location, shard)
+    counts = favorite_counts([p.id for p in products])
+    for p in products:
+        p.stock = stock.get(p.id, 0)
+        p.favorite_count = counts.get(p.id, 0)
+    return products
 
 @router.post("/orders", response_model=dict, tags=["orders"])
-def create_order(order_data: OrderCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)) -> dict:
+def create_order(order_data: OrderCreate, location: str = Depends(get_location), db: Session = Depends(get_location_db), current_user: User = Depends(get_current_user)) -> dict:
     # Don't use with db.begin() as it needs explicit commit
-    product = db.query(Product).with_for_update().get(order_data.product_id)
-    if not product:
+    inventory = db.execute(INVENTORY_FOR_UPDATE, {"location": location, "product_id": order_data.product_id}).scalars().first()
+    if not inventory:
         raise HTTPException(status_code=404, detail="Product not found")
-    if product.stock < order_data.quantity:
+    if inventory.stock < order_data.quantity:
         raise HTTPException(status_code=400, detail="Insufficient stock")
     
     new_order = Order(
-        product_id=product.id,
+        product_id=inventory.product_id,
         user_id=current_user.id,
+        location=location,
         quantity=order_data.quantity
     )
     
-    product.stock -= order_data.quantity
+    inventory.stock -= order_data.quantity
     db.add(new_order)
     db.commit()
     db.refresh(new_order)
+    delete_cache(f"stock:{location}")
     
-    publish_message("order_events", f"User {current_user.id} placed order for product {product.id} (qty: {order_data.quantity})")
+    # Structured so the fulfillment worker can batch orders by product
+    publish_message("order_events", json.dumps({
+        "event": "order_created",
+        "order_id": new_order.id,
+        "product_id": inventory.product_id,
+        "location": location,
+        "user_id": current_user.id,
+        "quantity": order_data.quantity
+    }))
     return {
         "message": "Order created",
         "order": OrderResponse.from_orm(new_order).dict()
     }
 
+@router.get("/batches", response_model=list[BakingBatchResponse], tags=["fulfillment"], dependencies=[Depends(admin_required)])
+def get_batches(status: str = "baking", location: str = Depends(get_location), db: Session = Depends(get_location_db)) -> list[BakingBatch]:
+    return db.query(BakingBatch).filter(
+        BakingBatch.location == location,
+        BakingBatch.status == status
+    ).order_by(BakingBatch.id).all()
+
+@router.post("/batches/{batch_id}/status", response_model=dict, tags=["fulfillment"], dependencies=[Depends(admin_required)])
+def update_batch_status(batch_id: int, update: BatchStatusUpdate, location: str = Depends(get_location), db: Session = Depends(get_location_db)) -> dict:
+    batch = db.query(BakingBatch).with_for_update().get(batch_id)
+    if not batch or batch.location != location:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    try:
+        moved = advance_batch(db, batch, update.status)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+    publish_message("fulfillment_events", json.dumps({
+        "event": "batch_status_changed",
+        "batch_id": batch.id,
+        "location": batch.location,
+        "status": batch.status
+    }))
+    return {
+        "message": "Batch updated",
+        "batch": BakingBatchResponse.from_orm(batch).dict(),
+        "orders_updated": moved
+    }
+
 @router.post("/cart/add", response_model=dict, tags=["cart"])
-def add_to_cart(cart_item: CartItem, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)) -> dict:
+def add_to_cart(cart_item: CartItem, db: Session = Depends(get_db), current_user: User = Depends(get_current_user),
+                location: str = Depends(get_location), shard: Session = Depends(get_location_db)) -> dict:
     product = db.query(Product).get(cart_item.product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    if product.stock < cart_item.quantity:
+    if get_location_stock(location, shard).get(product.id, 0) < cart_item.quantity:
         raise HTTPException(status_code=400, detail="Not enough stock")
     
-    cart_item_db = db.query(Cart).filter(
-        Cart.user_id == current_user.id,
-        Cart.product_id == cart_item.product_id
-    ).first()
+    cart_item_db = db.execute(CART_ITEM, {"user_id": current_user.id, "product_id": cart_item.product_id}).scalars().first()
     
     if cart_item_db:
         cart_item_db.quantity += cart_item.quantity
@@ -209,16 +310,48 @@ def add_to_cart(cart_item: CartItem, db: Session = Depends(get_db), current_user
     return {"message": "Product added to cart"}
 
 @router.get("/cart", response_model=list[CartResponse], tags=["cart"])
-def get_cart(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)) -> list[CartResponse]:
+def get_cart(current_user: User = Depends(get_current_user), db: Session = Depends(get_db),
+             location: str = Depends(get_location), shard: Session = Depends(get_location_db)) -> list[CartResponse]:
     cache_key = f"cart:{current_user.id}"
     cached_cart = get_cache(cache_key)
     if cached_cart:
-        return [CartResponse.parse_raw(item) for item in json.loads(cached_cart)]
-    
-    cart_items = db.query(Cart).filter(Cart.user_id == current_user.id).all()
-    serialized = [CartResponse.from_orm(item).json() for item in cart_items]
-    set_cache(cache_key, json.dumps(serialized))
-    return [CartResponse.from_orm(item) for item in cart_items]
+        cart = [CartResponse.parse_raw(item) for item in json.loads(cached_cart)]
+    else:
+        cart = [CartResponse.from_orm(item) for item in db.execute(CART_ITEMS, {"user_id": current_user.id}).scalars().all()]
+        set_cache(cache_key, json.dumps([item.json() for item in cart]))
+    # The cart is global; stock is shown for the requesting location
+    stock = get_location_stock(location, shard)
+    for item in cart:
+        item.product.stock = stock.get(item.product.id, 0)
+    return cart
+
+@router.post("/favorites/{product_id}", response_model=dict, tags=["favorites"])
+def add_to_favorites(product_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)) -> dict:
+    if not db.query(Product.id).filter(Product.id == product_id).first():
+        raise HTTPException(status_code=404, detail="Product not found")
+    try:
+        add_favorite(current_user.id, product_id)
+    except FavoritesUnavailable:
+        raise HTTPException(status_code=503, detail="Favorites are temporarily unavailable", headers={"Retry-After": "5"})
+    return {"message": "Product added to favorites"}
+
+@router.delete("/favorites/{product_id}", response_model=dict, tags=["favorites"])
+def remove_from_favorites(product_id: int, current_user: User = Depends(get_current_user)) -> dict:
+    try:
+        removed = remove_favorite(current_user.id, product_id)
+    except FavoritesUnavailable:
+        raise HTTPException(status_code=503, detail="Favorites are temporarily unavailable", headers={"Retry-After": "5"})
+    if not removed:
+        raise HTTPException(status_code=404, detail="Product is not a favorite")
+    return {"message": "Product removed from favorites"}
+
+@router.get("/favorites", response_model=FavoritesResponse, tags=["favorites"])
+def get_favorites(current_user: User = Depends(get_current_user)) -> FavoritesResponse:
+    return FavoritesResponse(product_ids=list_favorites(current_user.id))
+
+@router.get("/products/{product_id}/favorites", response_model=FavoriteCountResponse, tags=["favorites"])
+def get_favorite_count(product_id: int) -> FavoriteCountResponse:
+    return FavoriteCountResponse(product_id=product_id, favorite_count=favorite_counts([product_id]).get(product_id, 0))
 
 @router.get("/healthy")
 async def health_check() -> dict:
@@ -1,6 +1,6 @@
 from datetime import datetime
-from pydantic import BaseModel , EmailStr
-from typing import Optional
+from pydantic import BaseModel , EmailStr, Field
+from typing import Literal, Optional
 
 # User Schemas
 class UserCreate(BaseModel):
@@ -34,11 +34,24 @@ class ProductResponse(BaseModel):
     name: str
     price: float
     description: Optional[str]
-    stock: int
+    # Stock at the requesting location; filled in by the route
+    stock: Optional[int] = None
+    favorite_count: int = 0
 
     class Config:
         from_attributes = True
 
+# Favorite Schemas
+class FavoritesResponse(BaseModel):
+    product_ids: list[int]
+
+class FavoriteCountResponse(BaseModel):
+    product_id: int
+    favorite_count: int
+
+class InventoryUpdate(BaseModel):
+    stock: int = Field(ge=0)
+
 # Order Schemas
 class OrderCreate(BaseModel):
     product_id: int
@@ -47,12 +60,27 @@ class OrderCreate(BaseModel):
 class OrderResponse(BaseModel):
     id: int
     product_id: int
+    location: str
     quantity: int
     status: str
 
     class Config:
         from_attributes = True
 
+# Fulfillment Schemas
+class BakingBatchResponse(BaseModel):
+    id: int
+    product_id: int
+    location: str
+    order_ids: list[int]
+    status: str
+
+    class Config:
+        from_attributes = True
+
+class BatchStatusUpdate(BaseModel):
+    status: Literal["ready", "collected"]
+
 class CartItem(BaseModel):
     product_id: int
     quantity: int
@@ -0,0 +1,300 @@
+# src/utils/favorites.py
+import logging
+import threading
+import time
+import uuid
+
+import redis
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from src.config import settings
+from src.database import SessionLocal, engine
+from src.models.models import user_favorites
+from src.utils.redis_cache import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Redis is the source of truth for reads; Postgres is updated in batches
+USER_FAVORITES_KEY = "favorites:user:{user_id}"
+COUNTS_KEY = "favorites:counts"  # hash: product_id -> number of users
+PENDING_KEY = "favorites:pending"  # hash: "user_id:product_id" -> "1" (add) / "0" (remove)
+READY_KEY = "favorites:ready"  # set once Redis holds everything in user_favorites
+REBUILD_LOCK_KEY = "favorites:rebuild_lock"
+FLUSHING_KEY = "favorites:flushing:{token}"  # batch renamed away from PENDING_KEY
+FLUSHING_INDEX_KEY = "favorites:flushing_batches"  # sorted set: batch key -> time it was taken
+
+REBUILD_BATCH_SIZE = 5000
+
+
+class FavoritesUnavailable(Exception):
+    """Raised for favorite changes that cannot be applied because Redis is down."""
+
+
+class FavoritesNotReady(FavoritesUnavailable):
+    """Raised for favorite changes while Redis is still being rebuilt from Postgres."""
+
+
+# ARGV: product_id, +1 / -1, pending field ("" to skip recording the change)
+# Membership, count and pending change move together or not at all. Recorded
+# changes are refused (-1) until the rebuild has finished, so a removal cannot
+# be lost and then resurrected by the rebuild.
+TOGGLE_LUA = """
+if ARGV[3] ~= '' and redis.call('EXISTS', KEYS[4]) == 0 then
+    return -1
+end
+local changed
+if ARGV[2] == '1' then
+    changed = redis.call('SADD', KEYS[1], ARGV[1])
+else
+    changed = redis.call('SREM', KEYS[1], ARGV[1])
+end
+if changed == 1 then
+    redis.call('HINCRBY', KEYS[2], ARGV[1], tonumber(ARGV[2]))
+    if ARGV[3] ~= '' then
+        redis.call('HSET', KEYS[3], ARGV[3], ARGV[2] == '1' and '1' or '0')
+    end
+end
+return changed
+"""
+
+# KEYS: pending, batch, index; ARGV: now. Takes the pending changes for a
+# flush and records the batch in the index in one step, so a batch can never
+# exist without being findable by restore_stranded_batches.
+TAKE_BATCH_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('RENAME', KEYS[1], KEYS[2])
+redis.call('ZADD', KEYS[3], ARGV[1], KEYS[2])
+return 1
+"""
+
+# KEYS: batch, pending, index. Re-queues every change in a batch that was never
+# persisted, using the current membership rather than the batch's (possibly
+# stale) state. HSETNX keeps any newer pending change.
+RESTORE_LUA = """
+for _, field in ipairs(redis.call('HKEYS', KEYS[1])) do
+    local sep = string.find(field, ':', 1, true)
+    local user_key = 'favorites:user:' .. string.sub(field, 1, sep - 1)
+    local state = redis.call('SISMEMBER', user_key, string.sub(field, sep + 1))
+    redis.call('HSETNX', KEYS[2], field, tostring(state))
+end
+redis.call('ZREM', KEYS[3], KEYS[1])
+return redis.call('DEL', KEYS[1])
+"""
+
+_scripts = {}
+
+
+def _script(name, source):
+    redis_client = get_redis_client()
+    script = _scripts.get(name)
+    if script is None or script.registered_client is not redis_client:
+        script = redis_client.register_script(source)
+        _scripts[name] = script
+    return script
+
+
+def _toggle(user_id, product_id, add, record_pending=True, client=None):
+    pending_field = f"{user_id}:{product_id}" if record_pending else ""
+    return _script("toggle", TOGGLE_LUA)(
+        keys=[USER_FAVORITES_KEY.format(user_id=user_id), COUNTS_KEY, PENDING_KEY, READY_KEY],
+        args=[product_id, "1" if add else "-1", pending_field],
+        client=client,
+    )
+
+
+def _change(user_id, product_id, add):
+    try:
+        changed = _toggle(user_id, product_id, add)
+    except redis.RedisError as e:
+        logger.warning("Redis favorite change error", extra={"error": str(e)})
+        raise FavoritesUnavailable() from e
+    if changed == -1:
+        raise FavoritesNotReady()
+    return changed == 1
+
+
+def add_favorite(user_id, product_id):
+    """Return True if the product was not already a favorite.
+
+    Raises ``FavoritesUnavailable`` while Redis is down or being rebuilt.
+    """
+    return _change(user_id, product_id, add=True)
+
+
+def remove_favorite(user_id, product_id):
+    """Return True if the product was a favorite.
+
+    Raises ``FavoritesUnavailable`` while Redis is down or being rebuilt.
+    """
+    return _change(user_id, product_id, add=False)
+
+
+def list_favorites(user_id):
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        pipe.exists(READY_KEY)
+        pipe.smembers(USER_FAVORITES_KEY.format(user_id=user_id))
+        ready, members = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning("Redis list favorites error", extra={"error": str(e)})
+        ready = False
+    if not ready:
+        # Redis is down or still being rebuilt; Postgres has everything but the last flush interval
+        with SessionLocal() as db:
+            members = db.execute(
+                select(user_favorites.c.product_id).where(user_favorites.c.user_id == user_id)
+            ).scalars().all()
+    return sorted(int(product_id) for product_id in members)
+
+
+def favorite_counts(product_ids):
+    """Return ``{product_id: count}``; empty if Redis is unavailable, so callers can default to 0."""
+    if not product_ids:
+        return {}
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        pipe.exists(READY_KEY)
+        pipe.hmget(COUNTS_KEY, [str(product_id) for product_id in product_ids])
+        ready, counts = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning("Redis favorite counts error", extra={"error": str(e)})
+        return {}
+    if not ready:
+        with SessionLocal() as db:
+            rows = db.execute(
+                select(user_favorites.c.product_id, func.count())
+                .where(user_favorites.c.product_id.in_(product_ids))
+                .group_by(user_favorites.c.product_id)
+            ).all()
+        return dict(rows)
+    return {product_id: int(count or 0) for product_id, count in zip(product_ids, counts)}
+
+
+def restore_stranded_batches(min_age_seconds=None):
+    """Re-queue flush batches left behind by a worker that died mid-flush.
+
+    Only batches older than ``min_age_seconds`` (default: ten flush
+    intervals) are touched so that a flush still in progress is left alone.
+    Returns the number of batches restored.
+    """
+    if min_age_seconds is None:
+        min_age_seconds = 10 * settings.FAVORITES_FLUSH_INTERVAL_SECONDS
+    client = get_redis_client()
+    restored = 0
+    for batch_key in client.zrangebyscore(FLUSHING_INDEX_KEY, "-inf", time.time() - min_age_seconds):
+        if _script("restore", RESTORE_LUA)(keys=[batch_key, PENDING_KEY, FLUSHING_INDEX_KEY]):
+            logger.warning("Restored stranded favorites batch", extra={"key": batch_key})
+            restored += 1
+    return restored
+
+
+def flush_pending_favorites():
+    """Write accumulated favorite changes to ``user_favorites`` in one transaction.
+
+    The pending hash is renamed away atomically, so concurrent flushers in
+    other workers never see the same changes. Returns the number of changes.
+    """
+    client = get_redis_client()
+    batch_key = FLUSHING_KEY.format(token=uuid.uuid4().hex)
+    if not _script("take_batch", TAKE_BATCH_LUA)(keys=[PENDING_KEY, batch_key, FLUSHING_INDEX_KEY], args=[time.time()]):
+        return 0
+
+    changes = client.hgetall(batch_key)
+    adds, removes = [], []
+    for field, state in changes.items():
+        user_id, _, product_id = field.partition(":")
+        pair = (int(user_id), int(product_id))
+        (adds if state == "1" else removes).append(pair)
+
+    try:
+        with SessionLocal() as db:
+            if adds:
+                db.execute(
+                    insert(user_favorites)
+                    .values([{"user_id": u, "product_id": p} for u, p in adds])
+                    .on_conflict_do_nothing(constraint="_user_favorite_uc")
+                )
+            if removes:
+                db.execute(
+                    delete(user_favorites).where(
+                        tuple_(user_favorites.c.user_id, user_favorites.c.product_id).in_(removes)
+                    )
+                )
+            db.commit()
+    except Exception:
+        # Put the batch back without overwriting anything newer
+        _script("restore", RESTORE_LUA)(keys=[batch_key, PENDING_KEY, FLUSHING_INDEX_KEY])
+        raise
+
+    pipe = client.pipeline()
+    pipe.zrem(FLUSHING_INDEX_KEY, batch_key)
+    pipe.delete(batch_key)
+    pipe.execute()
+    return len(changes)
+
+
+def rebuild_favorites_if_needed():
+    """Load ``user_favorites`` into Redis when the cache is cold (e.g. after a Redis restart)."""
+    client = get_redis_client()
+    if client.exists(READY_KEY):
+        return False
+    if not client.set(REBUILD_LOCK_KEY, "1", nx=True, ex=300):
+        # Another worker is already rebuilding
+        return False
+    try:
+        # A removal that has not reached Postgres yet must not be resurrected
+        pending_removes = {field for field, state in client.hgetall(PENDING_KEY).items() if state == "0"}
+        loaded = 0
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=REBUILD_BATCH_SIZE).execute(
+                select(user_favorites.c.user_id, user_favorites.c.product_id)
+            )
+            for rows in result.partitions():
+                pipe = client.pipeline(transaction=False)
+                for user_id, product_id in rows:
+                    if f"{user_id}:{product_id}" not in pending_removes:
+                        _toggle(user_id, product_id, add=True, record_pending=False, client=pipe)
+                pipe.execute()
+                loaded += len(rows)
+        client.set(READY_KEY, "1")
+        logger.info("Rebuilt favorites cache from Postgres", extra={"rows": loaded})
+        return True
+    finally:
+        client.delete(REBUILD_LOCK_KEY)
+
+
+class FavoritesFlusher:
+    """Background thread that periodically persists pending favorite changes."""
+
+    def __init__(self, interval=None):
+        self.interval = interval or settings.FAVORITES_FLUSH_INTERVAL_SECONDS
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="favorites-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._flush()  # Final flush so shutdown does not strand changes in Redis
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._flush()
+
+    def _flush(self):
+        try:
+            # Redis may have been restarted or flushed since startup
+            rebuild_favorites_if_needed()
+            restore_stranded_batches()
+            flushed = flush_pending_favorites()
+            if flushed:
+                logger.debug("Flushed favorite changes", extra={"changes": flushed})
+        except Exception as e:
+            logger.error("Favorites flush failed", extra={"error": str(e)})
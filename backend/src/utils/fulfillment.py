@@ -0,0 +1,60 @@
+# src/utils/fulfillment.py
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src.models.models import BakingBatch
+
+# pending -> baking -> ready -> collected
+BATCH_TRANSITIONS = {
+    "baking": "ready",
+    "ready": "collected",
+}
+
+# Every transition is a single statement no matter how many orders it covers
+_MOVE_ORDERS = text(
+    "UPDATE orders SET status = :status "
+    "WHERE id = ANY(:ids) AND status = :expected"
+)
+_MOVE_ORDERS_RETURNING = text(_MOVE_ORDERS.text + " RETURNING id")
+
+
+def create_baking_batches(db: Session, location: str, orders: list[tuple[int, int]]) -> list[BakingBatch]:
+    """Group pending ``(order_id, product_id)`` pairs of one location into one baking batch per product.
+
+    ``db`` must be a session on that location's shard. Orders that are no
+    longer pending (e.g. redelivered events) are skipped. The caller commits.
+    """
+    by_product = defaultdict(set)
+    for order_id, product_id in orders:
+        by_product[product_id].add(order_id)
+
+    batches = []
+    for product_id, order_ids in by_product.items():
+        moved = db.execute(
+            _MOVE_ORDERS_RETURNING, {"status": "baking", "ids": sorted(order_ids), "expected": "pending"}
+        ).scalars().all()
+        if not moved:
+            continue
+        batch = BakingBatch(product_id=product_id, location=location, order_ids=sorted(moved), status="baking")
+        db.add(batch)
+        batches.append(batch)
+    db.flush()
+    return batches
+
+
+def advance_batch(db: Session, batch: BakingBatch, status: str) -> int:
+    """Move a batch and all of its orders to ``status``; returns the number of orders moved.
+
+    Raises ``ValueError`` if ``status`` is not the batch's next state. The caller commits.
+    """
+    if BATCH_TRANSITIONS.get(batch.status) != status:
+        raise ValueError(f"Cannot move batch from '{batch.status}' to '{status}'")
+    moved = db.execute(
+        _MOVE_ORDERS, {"status": status, "ids": batch.order_ids, "expected": batch.status}
+    ).rowcount
+    batch.status = status
+    batch.updated_at = datetime.utcnow()
+    return moved
@@ -0,0 +1,243 @@
+# src/utils/idempotency.py
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import time
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.responses import JSONResponse
+
+from src.config import settings
+from src.utils.rate_limit import token_subject
+from src.utils.redis_cache import get_async_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Writes that clients retry on flaky connections
+IDEMPOTENT_ROUTES = {
+    ("POST", "/api/orders"),
+    ("POST", "/api/cart/add"),
+}
+
+POLL_INTERVAL_SECONDS = 0.05
+
+# Only headers that describe the body are replayed (never Set-Cookie)
+REPLAYED_HEADERS = {b"content-type"}
+
+# {"committed": bool} for the idempotent request running on this context. Sync
+# handlers get a copy of the context, so they update the same dict.
+_request_writes: ContextVar = ContextVar("idempotency_writes", default=None)
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_committed(session):
+    writes = _request_writes.get()
+    if writes is not None:
+        writes["committed"] = True
+
+
+def _location(scope):
+    # Same resolution as the routes' get_location: header, then query, then the default
+    for key, value in scope["headers"]:
+        if key == b"x-location" and value:
+            return value.decode("latin-1")
+    location = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("location")
+    return location[0] if location and location[0] else settings.DEFAULT_LOCATION
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+class IdempotencyMiddleware:
+    """Honour an ``Idempotency-Key`` header on order and cart writes.
+
+    The first request claims the key with an in-flight marker and its
+    response is stored for ``IDEMPOTENCY_TTL_SECONDS``. Duplicates wait for
+    that result instead of running the handler, and replays are answered
+    straight from Redis without a database round trip.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in IDEMPOTENT_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        idempotency_key = None
+        for key, value in scope["headers"]:
+            if key == b"idempotency-key":
+                idempotency_key = value.decode("latin-1").strip()[:128]
+                break
+        user = token_subject(scope) if idempotency_key else None
+        if not user:
+            # No key, or unauthenticated (the route itself will answer 401)
+            await self.app(scope, receive, send)
+            return
+
+        body = await _read_body(receive)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        # Per location: the same key and body sent to another store is a different order
+        store_key = f"idempotency:{scope['path']}:{_location(scope)[:32]}:{user}:{idempotency_key}"
+
+        async def replay_receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        try:
+            client = get_async_redis_client()
+            claimed = await client.set(
+                store_key,
+                json.dumps({"state": "in_flight", "fingerprint": fingerprint}),
+                nx=True,
+                ex=settings.IDEMPOTENCY_IN_FLIGHT_TTL_SECONDS,
+            )
+        except Exception as e:
+            # Without Redis we cannot deduplicate; behave as if no key was sent
+            logger.warning("Idempotency store unavailable", extra={"error": str(e)})
+            await self.app(scope, replay_receive, send)
+            return
+
+        if claimed:
+            await self._execute(scope, replay_receive, send, client, store_key, fingerprint)
+        else:
+            await self._replay(scope, receive, send, client, store_key, fingerprint)
+
+    async def _execute(self, scope, receive, send, client, store_key, fingerprint):
+        captured = {"status": 500, "headers": [], "body": []}
+
+        async def capturing_send(message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = [
+                    [k.decode("latin-1"), v.decode("latin-1")]
+                    for k, v in message.get("headers", []) if k.lower() in REPLAYED_HEADERS
+                ]
+            elif message["type"] == "http.response.body":
+                captured["body"].append(message.get("body", b""))
+            await send(message)
+
+        # A slow request (pool wait, row locks) must not lose the marker and let a retry run twice
+        finished = asyncio.Event()
+        heartbeat = asyncio.create_task(self._renew(client, store_key, finished))
+        writes = {"committed": False}
+        token = _request_writes.set(writes)
+        try:
+            await self.app(scope, receive, capturing_send)
+        except BaseException:
+            heartbeat.cancel()
+            await self._fail(client, store_key, fingerprint, writes)
+            raise
+        finally:
+            _request_writes.reset(token)
+        # Let an in-progress renewal land before the final record, so it cannot shorten its TTL
+        finished.set()
+        await heartbeat
+
+        if captured["status"] >= 500:
+            await self._fail(client, store_key, fingerprint, writes)
+            return
+        record = {
+            "state": "done",
+            "fingerprint": fingerprint,
+            "status": captured["status"],
+            "headers": captured["headers"],
+            "body": base64.b64encode(b"".join(captured["body"])).decode("ascii"),
+        }
+        await self._store(client, store_key, record)
+
+    async def _fail(self, client, store_key, fingerprint, writes):
+        if not writes["committed"]:
+            # Nothing was written yet, so a retry can safely run the handler again
+            await self._release(client, store_key)
+            return
+        # The write may have gone through (e.g. commit, then the publish failed);
+        # running it again could sell the same stock twice
+        await self._store(client, store_key, {"state": "unknown", "fingerprint": fingerprint})
+
+    @staticmethod
+    async def _store(client, store_key, record):
+        try:
+            await client.set(store_key, json.dumps(record), ex=settings.IDEMPOTENCY_TTL_SECONDS)
+        except Exception as e:
+            logger.warning("Failed to store idempotent response", extra={"key": store_key, "error": str(e)})
+
+    async def _replay(self, scope, receive, send, client, store_key, fingerprint):
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            try:
+                raw = await client.get(store_key)
+            except Exception as e:
+                # A Redis blip: keep waiting for the first request rather than failing the duplicate
+                logger.warning("Idempotency store unavailable", extra={"key": store_key, "error": str(e)})
+                if time.monotonic() >= deadline:
+                    response = JSONResponse({"detail": "Idempotency store unavailable"}, status_code=503,
+                                            headers={"Retry-After": "1"})
+                    break
+                await asyncio.sleep(POLL_INTERVAL_SECONDS)
+                continue
+            if raw is None:
+                # The first attempt failed and released the key; tell the client to retry
+                response = JSONResponse({"detail": "Original request failed, retry"}, status_code=409,
+                                        headers={"Retry-After": "1"})
+                break
+            record = json.loads(raw)
+            if record["fingerprint"] != fingerprint:
+                response = JSONResponse({"detail": "Idempotency-Key reused with a different request body"},
+                                        status_code=422)
+                break
+            if record["state"] == "done":
+                await send({
+                    "type": "http.response.start",
+                    "status": record["status"],
+                    "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in record["headers"]]
+                    + [(b"idempotent-replayed", b"true")],
+                })
+                await send({"type": "http.response.body", "body": base64.b64decode(record["body"])})
+                return
+            if record["state"] == "unknown":
+                response = JSONResponse({"detail": "Original request failed after saving changes; "
+                                                   "check its outcome instead of retrying"},
+                                        status_code=409)
+                break
+            if time.monotonic() >= deadline:
+                response = JSONResponse({"detail": "Request with this Idempotency-Key is still in progress"},
+                                        status_code=409, headers={"Retry-After": "1"})
+                break
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        await response(scope, receive, send)
+
+    @staticmethod
+    async def _renew(client, store_key, finished):
+        ttl = settings.IDEMPOTENCY_IN_FLIGHT_TTL_SECONDS
+        while True:
+            try:
+                await asyncio.wait_for(finished.wait(), ttl / 3)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await client.expire(store_key, ttl)
+            except Exception as e:
+                logger.warning("Failed to renew idempotency marker", extra={"key": store_key, "error": str(e)})
+
+    @staticmethod
+    async def _release(client, store_key):
+        try:
+            await client.delete(store_key)
+        except Exception as e:
+            logger.warning("Failed to release idempotency key", extra={"key": store_key, "error": str(e)})
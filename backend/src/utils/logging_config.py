@@ -0,0 +1,186 @@
+# src/utils/logging_config.py
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import traceback
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from src.config import settings
+
+# Request id of the request being handled; copied into sync handler threads
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Attributes every LogRecord has; anything else was passed via `extra=`
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "request_id", "exc_trace"}
+
+# `extra=` values of these types are passed to the listener as they are
+_PLAIN_TYPES = (str, int, float, bool, type(None))
+
+_listener = None
+_listener_pid = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Render records as one JSON object per line. Runs on the listener thread."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "pid": record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif getattr(record, "exc_trace", None) is not None:
+            entry["exc"] = "".join(record.exc_trace.format()).rstrip("\n")
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records with their message rendered but their traceback unformatted.
+
+    Arguments and ``extra=`` values are rendered on the calling thread, as
+    they may be mutable or ORM objects tied to this thread's session. The
+    stock ``prepare`` also formats the traceback there and folds it into
+    ``msg``; here it is only captured, without its frames or source lines,
+    and formatted into the ``exc`` field on the listener thread.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not isinstance(value, _PLAIN_TYPES):
+                record.__dict__[key] = str(value)
+        if record.exc_info:
+            record.exc_trace = traceback.TracebackException(*record.exc_info, lookup_lines=False)
+            record.exc_info = None
+        return record
+
+
+class ContextFilter(logging.Filter):
+    """Tag records with the request id and drop most DEBUG records from noisy loggers.
+
+    Attached to the QueueHandler so it runs on the calling thread, where the
+    request context is still available, and before anything is enqueued.
+    """
+
+    def __init__(self, sampled_prefixes, sample_rate):
+        super().__init__()
+        self.sampled_prefixes = tuple(sampled_prefixes)
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if (
+            record.levelno <= logging.DEBUG
+            and record.name.startswith(self.sampled_prefixes)
+            and random.random() >= self.sample_rate
+        ):
+            return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Route all logging through a queue drained by a background listener.
+
+    Safe to call more than once; after a fork the listener thread does not
+    survive, so the pipeline is rebuilt for the new process.
+    """
+    global _listener, _listener_pid
+    if _listener_pid == os.getpid():
+        return
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter(
+        [name.strip() for name in settings.LOG_SAMPLED_LOGGERS.split(",") if name.strip()],
+        settings.LOG_SAMPLE_RATE,
+    ))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    # Let server loggers go through the same pipeline instead of their own handlers
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access", "gunicorn.error"):
+        server_logger = logging.getLogger(name)
+        server_logger.handlers.clear()
+        server_logger.propagate = True
+
+    for name, level in _parse_levels(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener.start()
+    _listener_pid = os.getpid()
+
+
+def stop_logging():
+    # Flush whatever is still queued; only the process that started it may stop it
+    global _listener, _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None
+    _listener_pid = None
+
+
+atexit.register(stop_logging)
+
+
+class RequestIdMiddleware:
+    """Bind an X-Request-ID (incoming or generated) to the request's log records."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope["headers"]:
+            if key == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,178 @@
+# src/utils/order_partitions.py
+"""Maintenance for the monthly range partitions of ``orders``.
+
+Run it once, or keep it running and repeat every
+``ORDERS_MAINTENANCE_INTERVAL_SECONDS`` (the ``partitions`` compose service):
+
+    python -m src.utils.order_partitions [--loop]
+
+It creates partitions ``ORDERS_PARTITIONS_AHEAD`` months into the future and
+moves partitions older than ``ORDERS_RETAIN_MONTHS`` out of the table: each
+one is detached, copied to a gzip-compressed CSV under ``ORDERS_ARCHIVE_DIR``
+and then dropped. Rows that landed in the ``orders_default`` partition
+because their month had no partition yet are moved into the new partition
+when it is created. Every step is idempotent, so an interrupted run is simply
+finished by the next one. Each shard database is maintained in turn.
+"""
+import argparse
+import gzip
+import logging
+import os
+import re
+import time
+from datetime import date
+from pathlib import Path
+
+from sqlalchemy import text
+
+from src.config import settings
+from src.database import all_engines
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME_RE = re.compile(r"^orders_(\d{4})_(\d{2})$")
+
+# Arbitrary constant shared by all runners so only one runs at a time
+ADVISORY_LOCK_ID = 0x0D0E5
+
+
+def _add_months(month_start, months):
+    index = month_start.year * 12 + month_start.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month_start):
+    return f"orders_{month_start.year:04d}_{month_start.month:02d}"
+
+
+def _partition_tables(conn):
+    """Return {month_start: (table name, attached?)} for every orders_YYYY_MM table."""
+    rows = conn.execute(text(
+        "SELECT relname, relispartition FROM pg_class "
+        "WHERE relkind = 'r' AND relname ~ '^orders_[0-9]{4}_[0-9]{2}$'"
+    ))
+    tables = {}
+    for name, attached in rows:
+        match = PARTITION_NAME_RE.match(name)
+        tables[date(int(match.group(1)), int(match.group(2)), 1)] = (name, attached)
+    return tables
+
+
+def ensure_future_partitions(conn, months_ahead, today=None):
+    """Create any missing partitions from the current month through ``months_ahead``."""
+    current = (today or date.today()).replace(day=1)
+    existing = _partition_tables(conn)
+    created = []
+    for offset in range(months_ahead + 1):
+        month_start = _add_months(current, offset)
+        if month_start in existing:
+            continue
+        name = partition_name(month_start)
+        bounds = {"start": month_start, "end": _add_months(month_start, 1)}
+        # CREATE ... PARTITION OF fails if orders_default already holds rows for this
+        # month, so build the table standalone, move those rows over, then attach it
+        conn.execute(text(f"CREATE TABLE {name} (LIKE orders INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        conn.execute(text(
+            f"WITH moved AS (DELETE FROM orders_default WHERE created_at >= :start AND created_at < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ), bounds)
+        conn.execute(text(
+            f"ALTER TABLE orders ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{bounds['start'].isoformat()}') TO ('{bounds['end'].isoformat()}')"
+        ))
+        created.append(name)
+    return created
+
+
+def _archive_table(engine, name, archive_dir):
+    """Write a detached partition to ``<archive_dir>/<name>.csv.gz`` and drop it."""
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    target = archive_dir / f"{name}.csv.gz"
+    partial = target.with_suffix(".gz.partial")
+
+    copy_sql = f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)"
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cursor, gzip.open(partial, "wb") as archive:
+            if engine.dialect.driver == "psycopg":
+                # psycopg 3 (DB_DRIVER=psycopg) streams COPY through cursor.copy()
+                with cursor.copy(copy_sql) as copy:
+                    for chunk in copy:
+                        archive.write(chunk)
+            else:
+                cursor.copy_expert(copy_sql, archive)
+        raw.commit()
+    finally:
+        raw.close()
+    with open(partial, "rb") as archive:
+        os.fsync(archive.fileno())
+    # Only drop the data once a complete archive is on disk
+    os.replace(partial, target)
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE {name}"))
+    return target
+
+
+def archive_old_partitions(engine, retain_months, archive_dir, today=None):
+    """Detach, archive and drop partitions that ended more than ``retain_months`` ago."""
+    cutoff = _add_months((today or date.today()).replace(day=1), -retain_months)
+    with engine.begin() as conn:
+        expired = {month: table for month, table in _partition_tables(conn).items() if month < cutoff}
+        for name, attached in expired.values():
+            if attached:
+                conn.execute(text(f"ALTER TABLE orders DETACH PARTITION {name}"))
+
+    archived = []
+    for name, _ in sorted(expired.values()):
+        archived.append(_archive_table(engine, name, archive_dir))
+    return archived
+
+
+def maintain_database(engine, archive_dir, archive=True):
+    # Session-level lock on an autocommit connection, so no transaction is held open
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": ADVISORY_LOCK_ID}).scalar():
+            logger.info("Orders partition maintenance already running elsewhere")
+            return
+        try:
+            with engine.begin() as conn:
+                created = ensure_future_partitions(conn, settings.ORDERS_PARTITIONS_AHEAD)
+            logger.info("Ensured future orders partitions", extra={"created": created})
+            if archive:
+                archived = archive_old_partitions(engine, settings.ORDERS_RETAIN_MONTHS, archive_dir)
+                logger.info("Archived old orders partitions", extra={"archived": [str(p) for p in archived]})
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": ADVISORY_LOCK_ID})
+
+
+def run_maintenance(archive=True):
+    for index, engine in enumerate(all_engines()):
+        # Partition names repeat across shards, so each database archives into its own directory
+        archive_dir = Path(settings.ORDERS_ARCHIVE_DIR)
+        if index:
+            archive_dir = archive_dir / f"{engine.url.host}_{engine.url.port}_{engine.url.database}"
+        maintain_database(engine, archive_dir, archive)
+
+
+def run_forever(interval=None, archive=True):
+    """Run maintenance now and then every ``interval`` seconds; a failed run is retried next time."""
+    interval = interval or settings.ORDERS_MAINTENANCE_INTERVAL_SECONDS
+    while True:
+        try:
+            run_maintenance(archive)
+        except Exception as e:
+            logger.error("Orders partition maintenance failed", extra={"error": str(e)})
+        time.sleep(interval)
+
+if __name__ == '__main__':
+    from src.utils.logging_config import setup_logging
+    setup_logging()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--skip-archive", action="store_true", help="only create upcoming partitions")
+    parser.add_argument("--loop", action="store_true", help="repeat every ORDERS_MAINTENANCE_INTERVAL_SECONDS")
+    args = parser.parse_args()
+    if args.loop:
+        run_forever(archive=not args.skip_archive)
+    else:
+        run_maintenance(archive=not args.skip_archive)
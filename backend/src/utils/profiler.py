@@ -0,0 +1,462 @@
+# src/utils/profiler.py
+"""Low-overhead statistical profiler, one per worker process.
+
+A background thread snapshots every thread's Python stack with
+``sys._current_frames()`` at ``PROFILER_INTERVAL_SECONDS``. Captures are
+built from those samples:
+
+* ``window``: everything sampled while a timed profiling window is open;
+* ``request``: a request chosen by the sampling fraction, or any request
+  slower than the slow-request threshold, together with its SQL, Redis and
+  AMQP timeline. A sample belongs to a request when the thread was running
+  in that request's context: threadpool calls (dependencies, the handler,
+  response validation) and event-loop callbacks (serialization) alike.
+
+Nothing is sampled until a window, a request fraction or a slow-request
+threshold is configured (``PROFILER_SLOW_REQUEST_MS`` is off by default).
+
+The configuration is shared through Redis: every worker's profiler thread
+polls it once a second, so a window or request fraction covers all workers.
+Captures are published to Redis as well, so any worker can list and serve
+them; only the last ``PROFILER_MAX_CAPTURES`` are kept.
+"""
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import Context, ContextVar
+
+import redis
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Timeline of the request being profiled on this context, or None
+current_timeline: ContextVar = ContextVar("profiler_timeline", default=None)
+
+MAX_STACK_DEPTH = 128
+
+CONFIG_KEY = "profiler:config"  # JSON, shared by all workers
+CAPTURES_KEY = "profiler:captures"  # list of capture summaries, newest first
+CAPTURE_KEY = "profiler:capture:{capture_id}"
+CONFIG_POLL_SECONDS = 1.0
+CAPTURE_TTL_SECONDS = 24 * 60 * 60
+
+# Frames that run a callback inside a contextvars.Context: anyio's threadpool
+# worker (local "context") and asyncio's Handle._run (self._context). The
+# innermost one tells which request a thread is working for.
+CONTEXT_RUNNERS = {
+    ("_asyncio.py", "run"): lambda local_vars: local_vars.get("context"),
+    ("events.py", "_run"): lambda local_vars: getattr(local_vars.get("self"), "_context", None),
+}
+
+# Leaf frames of threads that are parked rather than doing work
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("handlers.py", "_monitor"),
+}
+
+
+class Timeline:
+    """I/O events of one profiled request and the threads that ran them.
+
+    Thread intervals are only a fallback for samples whose request context
+    could not be found (e.g. an event loop without Python-level handles).
+    """
+
+    __slots__ = ("events", "threads")
+
+    def __init__(self):
+        self.events = []  # (kind, detail, started, finished)
+        self.threads = []  # (thread id, started, finished)
+
+    def add(self, kind, detail, started, finished):
+        self.events.append((kind, detail, started, finished))
+        self.threads.append((threading.get_ident(), started, finished))
+
+
+class span:
+    """Record a timed ``kind`` event on the current request's timeline, if it has one."""
+
+    __slots__ = ("timeline", "kind", "detail", "started")
+
+    def __init__(self, kind, detail):
+        self.timeline = current_timeline.get()
+        self.kind = kind
+        self.detail = detail
+
+    def __enter__(self):
+        if self.timeline is not None:
+            self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        if self.timeline is not None:
+            self.timeline.add(self.kind, str(self.detail)[:200], self.started, time.monotonic())
+        return False
+
+
+# Registered on the Engine class so shard engines created later are covered too
+@event.listens_for(Engine, "before_cursor_execute")
+def _sql_started(conn, cursor, statement, parameters, context, executemany):
+    if current_timeline.get() is not None:
+        conn.info.setdefault("profiler_started", []).append(time.monotonic())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _sql_finished(conn, cursor, statement, parameters, context, executemany):
+    timeline = current_timeline.get()
+    if timeline is not None and conn.info.get("profiler_started"):
+        started = conn.info["profiler_started"].pop()
+        timeline.add("sql", statement[:200], started, time.monotonic())
+
+
+def _frame_name(frame):
+    name, file, line = frame
+    return f"{name} ({os.path.basename(file)}:{line})"
+
+
+def _redis():
+    # Imported lazily: redis_cache imports span from this module
+    from src.utils.redis_cache import get_redis_client
+    return get_redis_client()
+
+
+class Profiler:
+    def __init__(self):
+        self.interval = settings.PROFILER_INTERVAL_SECONDS
+        self.slow_request_ms = settings.PROFILER_SLOW_REQUEST_MS
+        self.request_fraction = 0.0
+        self.window_until = 0.0
+        self.window_started = 0.0
+        self.window_id = None
+        self.window_stacks = Counter()
+        self.samples = deque(maxlen=max(1, int(settings.PROFILER_SAMPLE_HISTORY_SECONDS / self.interval)) * 8)
+        self.captures = deque(maxlen=settings.PROFILER_MAX_CAPTURES)
+        self.unpublished = deque()
+        self.capture_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self._config_raw = None
+        self._config_checked = 0.0
+        self._idle_codes = {}
+        self._runner_codes = {}
+
+    # Control
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+
+    def configure(self, duration_s=0.0, request_fraction=None, slow_request_ms=None):
+        """Change the configuration of every worker; returns the new configuration."""
+        try:
+            config = json.loads(_redis().get(CONFIG_KEY) or "{}")
+        except redis.RedisError as e:
+            logger.warning("Profiler config unavailable", extra={"error": str(e)})
+            config = {}
+        if request_fraction is not None:
+            config["request_fraction"] = request_fraction
+        if slow_request_ms is not None:
+            config["slow_request_ms"] = slow_request_ms
+        if duration_s > 0:
+            now = time.time()
+            config["window_started"], config["window_until"] = now, now + duration_s
+        raw = json.dumps(config)
+        try:
+            _redis().set(CONFIG_KEY, raw)
+        except redis.RedisError as e:
+            # Still configure this worker, so profiling works without Redis
+            logger.warning("Failed to share profiler config", extra={"error": str(e)})
+        self._apply_config(raw)
+        self.start()
+        self.wake.set()
+        return config
+
+    def _sync_config(self):
+        now = time.monotonic()
+        if now - self._config_checked < CONFIG_POLL_SECONDS:
+            return
+        self._config_checked = now
+        try:
+            raw = _redis().get(CONFIG_KEY)
+        except redis.RedisError:
+            return  # keep the current configuration until Redis is back
+        if raw != self._config_raw:
+            self._apply_config(raw)
+
+    def _apply_config(self, raw):
+        config = json.loads(raw or "{}")
+        self.request_fraction = config.get("request_fraction", 0.0)
+        self.slow_request_ms = config.get("slow_request_ms", settings.PROFILER_SLOW_REQUEST_MS)
+        window_id = config.get("window_started")
+        if window_id != self.window_id and config.get("window_until", 0) > time.time():
+            # Wall-clock window from the config, mapped onto this process's monotonic clock
+            offset = time.monotonic() - time.time()
+            with self.lock:
+                self.window_stacks = Counter()
+            self.window_started = window_id + offset
+            self.window_until = config["window_until"] + offset
+        self.window_id = window_id
+        self._config_raw = raw
+
+    def status(self):
+        try:
+            captures = [json.loads(summary) for summary in _redis().lrange(CAPTURES_KEY, 0, -1)]
+        except redis.RedisError as e:
+            logger.warning("Shared profiler captures unavailable", extra={"error": str(e)})
+            captures = [_summary(capture) for capture in reversed(self.captures)]
+        return {
+            "pid": os.getpid(),
+            "interval_s": self.interval,
+            "slow_request_ms": self.slow_request_ms,
+            "request_fraction": self.request_fraction,
+            "window_remaining_s": max(0.0, self.window_until - time.monotonic()),
+            "captures": captures,
+        }
+
+    def get_capture(self, capture_id):
+        for capture in list(self.captures):
+            if capture["id"] == capture_id:
+                return capture
+        try:
+            raw = _redis().get(CAPTURE_KEY.format(capture_id=capture_id))
+        except redis.RedisError as e:
+            logger.warning("Shared profiler captures unavailable", extra={"error": str(e)})
+            return None
+        return json.loads(raw) if raw else None
+
+    # Sampling
+
+    def _active(self):
+        return self.slow_request_ms > 0 or self.request_fraction > 0 or time.monotonic() < self.window_until
+
+    def _is_idle(self, code):
+        idle = self._idle_codes.get(code)
+        if idle is None:
+            idle = (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES
+            self._idle_codes[code] = idle
+        return idle
+
+    def _context_of(self, code):
+        if code not in self._runner_codes:
+            self._runner_codes[code] = CONTEXT_RUNNERS.get((os.path.basename(code.co_filename), code.co_name))
+        return self._runner_codes[code]
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.is_set():
+            self._sync_config()
+            self._publish()
+            if not self._active():
+                self._finish_window()
+                self.wake.wait(CONFIG_POLL_SECONDS)
+                self.wake.clear()
+                continue
+            attribute = self.slow_request_ms > 0 or self.request_fraction > 0
+            now = time.monotonic()
+            taken = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or self._is_idle(frame.f_code):
+                    continue
+                stack, timeline = [], None
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(code)
+                    if attribute and timeline is None:
+                        context_of = self._context_of(code)
+                        if context_of is not None:
+                            context = context_of(frame.f_locals)
+                            # False marks "context found, not a profiled request"
+                            if isinstance(context, Context):
+                                timeline = context.get(current_timeline) or False
+                    frame = frame.f_back
+                stack.reverse()
+                taken.append((now, thread_id, tuple(stack), timeline))
+            with self.lock:
+                self.samples.extend(taken)
+                if now < self.window_until:
+                    self.window_stacks.update((thread_id, stack) for _, thread_id, stack, _ in taken)
+            self._finish_window()
+            time.sleep(self.interval)
+        self._publish()
+
+    def _finish_window(self):
+        if self.window_until and time.monotonic() >= self.window_until:
+            with self.lock:
+                stacks, self.window_stacks = self.window_stacks, Counter()
+            duration_ms = (self.window_until - self.window_started) * 1000
+            self.window_until = 0.0
+            self._store("window", f"{duration_ms / 1000:g}s window", duration_ms, stacks, [])
+
+    # Request captures
+
+    def should_profile_request(self):
+        return self.request_fraction > 0 and random.random() < self.request_fraction
+
+    def capture_request(self, name, started, finished, timeline):
+        with self.lock:
+            samples = [
+                (thread_id, stack) for at, thread_id, stack, owner in self.samples
+                if started <= at <= finished and (
+                    owner is timeline
+                    # No request context found: fall back to the threads that ran this request's I/O
+                    or owner is None and any(tid == thread_id and s <= at <= e for tid, s, e in timeline.threads)
+                )
+            ]
+        relative = [(kind, detail, (s - started) * 1000, (e - started) * 1000) for kind, detail, s, e in timeline.events]
+        self._store("request", name, (finished - started) * 1000, Counter(samples), relative)
+
+    def _store(self, kind, name, duration_ms, stacks, timeline):
+        capture = {
+            "id": f"{os.getpid()}-{next(self.capture_ids)}",
+            "pid": os.getpid(),
+            "kind": kind,
+            "name": name,
+            "duration_ms": round(duration_ms, 1),
+            "sample_count": sum(stacks.values()),
+            # Plain data, so it can be shared with the other workers
+            "stacks": [
+                [thread_id, [[code.co_name, code.co_filename, code.co_firstlineno] for code in stack], count]
+                for (thread_id, stack), count in stacks.most_common()
+            ],
+            "timeline": timeline,
+        }
+        self.captures.append(capture)
+        # Published from the profiler thread, never from the request path
+        self.unpublished.append(capture)
+        self.wake.set()
+
+    def _publish(self):
+        while self.unpublished:
+            capture = self.unpublished[0]
+            try:
+                pipe = _redis().pipeline()
+                pipe.set(CAPTURE_KEY.format(capture_id=capture["id"]), json.dumps(capture), ex=CAPTURE_TTL_SECONDS)
+                pipe.lpush(CAPTURES_KEY, json.dumps(_summary(capture)))
+                pipe.ltrim(CAPTURES_KEY, 0, settings.PROFILER_MAX_CAPTURES - 1)
+                pipe.execute()
+            except redis.RedisError as e:
+                logger.warning("Failed to publish profiler capture", extra={"id": capture["id"], "error": str(e)})
+                return
+            self.unpublished.popleft()
+
+    # Export
+
+    def to_collapsed(self, capture):
+        """Brendan Gregg's folded format, one line per distinct stack, rooted at the thread."""
+        lines = []
+        for thread_id, stack, count in capture["stacks"]:
+            frames = [f"thread-{thread_id}"] + [_frame_name(frame) for frame in stack]
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self, capture):
+        """Speedscope JSON: one sampled profile per thread plus the request's I/O timeline."""
+        frames, frame_index = [], {}
+
+        def index(name, file=None, line=None):
+            key = (name, file, line)
+            if key not in frame_index:
+                frame_index[key] = len(frames)
+                frames.append({"name": name, "file": file, "line": line} if file else {"name": name})
+            return frame_index[key]
+
+        interval_ms = self.interval * 1000
+        by_thread = {}
+        for thread_id, stack, count in capture["stacks"]:
+            samples, weights = by_thread.setdefault(thread_id, ([], []))
+            samples.append([index(*frame) for frame in stack])
+            weights.append(count * interval_ms)
+
+        profiles = [
+            {
+                "type": "sampled",
+                "name": f"thread-{thread_id}",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }
+            for thread_id, (samples, weights) in by_thread.items()
+        ]
+
+        if capture["timeline"]:
+            events, cursor = [], 0.0
+            for kind, detail, start, end in sorted(capture["timeline"], key=lambda span: span[2]):
+                # Evented profiles must nest; clamp overlapping spans from other threads
+                start = max(start, cursor)
+                end = max(end, start)
+                frame = index(f"{kind}: {detail}")
+                events.append({"type": "O", "frame": frame, "at": start})
+                events.append({"type": "C", "frame": frame, "at": end})
+                cursor = end
+            profiles.append({
+                "type": "evented",
+                "name": "sql/cache timeline",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": max(capture["duration_ms"], cursor),
+                "events": events,
+            })
+
+        return json.dumps({
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": capture["name"],
+            "exporter": "bakery-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        })
+
+
+def _summary(capture):
+    return {key: capture[key] for key in ("id", "pid", "kind", "name", "duration_ms", "sample_count")}
+
+
+profiler = Profiler()
+
+
+class ProfilingMiddleware:
+    """Attach a timeline to sampled requests and capture any request that runs slow."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler._active():
+            await self.app(scope, receive, send)
+            return
+
+        sampled = profiler.should_profile_request()
+        timeline = Timeline()
+        token = current_timeline.set(timeline)
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            finished = time.monotonic()
+            current_timeline.reset(token)
+            slow = profiler.slow_request_ms > 0 and (finished - started) * 1000 >= profiler.slow_request_ms
+            if sampled or slow:
+                profiler.capture_request(f"{scope['method']} {scope['path']}", started, finished, timeline)
@@ -0,0 +1,158 @@
+# src/utils/rate_limit.py
+import logging
+import math
+
+from jose import JWTError, jwt
+from starlette.responses import JSONResponse
+
+from src.config import settings
+from src.database import db_pool_wait_ms
+from src.utils.redis_cache import get_async_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Consume one token from every bucket in KEYS, or from none of them.
+# ARGV holds (capacity, refill tokens per second) for each key in order.
+# Returns 0 when admitted, otherwise the milliseconds until a token is available.
+TOKEN_BUCKET_LUA = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local tokens = {}
+local wait_ms = 0
+for i = 1, #KEYS do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', KEYS[i], 't', 'ts')
+    local available = tonumber(bucket[1]) or capacity
+    local last_ms = tonumber(bucket[2]) or now_ms
+    available = math.min(capacity, available + (now_ms - last_ms) * rate / 1000)
+    tokens[i] = available
+    if available < 1 then
+        wait_ms = math.max(wait_ms, math.ceil((1 - available) * 1000 / rate))
+    end
+end
+if wait_ms > 0 then
+    return wait_ms
+end
+for i = 1, #KEYS do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    redis.call('HSET', KEYS[i], 't', tostring(tokens[i] - 1), 'ts', tostring(now_ms))
+    redis.call('PEXPIRE', KEYS[i], math.ceil(capacity * 1000 / rate) + 1000)
+end
+return 0
+"""
+
+# Expensive or abusable endpoints get their own, tighter buckets
+ROUTE_CLASSES = {
+    ("POST", "/api/login"): "auth",
+    ("POST", "/api/register"): "auth",
+    ("POST", "/api/orders"): "orders",
+    ("GET", "/api/users"): "user_list",
+}
+
+# route class -> {"ip"/"user": (capacity, refill tokens per second)}
+RATE_LIMITS = {
+    "auth": {"ip": (10, 10 / 60)},
+    "orders": {"ip": (60, 2.0), "user": (20, 1.0)},
+    "user_list": {"ip": (20, 1.0), "user": (10, 0.5)},
+    "default": {"ip": (200, 50.0), "user": (100, 20.0)},
+}
+
+# Never limited or shed, so container health checks keep passing under load
+EXEMPT_PATHS = {"/api/healthy"}
+
+
+def _client_ip(scope):
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def token_subject(scope):
+    """Return the verified ``sub`` of the auth cookie without touching the database."""
+    # Verified so a forged token cannot drain another user's bucket
+    for key, value in scope["headers"]:
+        if key != b"cookie":
+            continue
+        for part in value.decode("latin-1").split(";"):
+            name, _, token = part.strip().partition("=")
+            if name == "token" and token:
+                try:
+                    payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=["HS256"])
+                except JWTError:
+                    return None
+                return payload.get("sub")
+    return None
+
+
+class RateLimitMiddleware:
+    """Reject over-limit clients (429) and shed load when this worker is saturated (503)."""
+
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = 0
+        self.script = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        rejection = self._shed() or await self._limit(scope)
+        if rejection is not None:
+            await rejection(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+    def _shed(self):
+        if self.in_flight >= settings.MAX_IN_FLIGHT_REQUESTS:
+            return self._reject(503, "Server busy", 1)
+        if db_pool_wait_ms() > settings.DB_POOL_WAIT_SHED_MS:
+            return self._reject(503, "Server busy", 1)
+        return None
+
+    async def _limit(self, scope):
+        if not settings.RATE_LIMIT_ENABLED:
+            return None
+        route_class = ROUTE_CLASSES.get((scope["method"], scope["path"]), "default")
+        limits = RATE_LIMITS[route_class]
+
+        identities = {"ip": _client_ip(scope)}
+        if "user" in limits:
+            user = token_subject(scope)
+            if user:
+                identities["user"] = user
+
+        keys, args = [], []
+        for dimension, identity in identities.items():
+            if dimension in limits:
+                capacity, rate = limits[dimension]
+                keys.append(f"ratelimit:{route_class}:{dimension}:{identity}")
+                args.extend([capacity, rate])
+
+        try:
+            client = get_async_redis_client()
+            if self.script is None or self.script.registered_client is not client:
+                self.script = client.register_script(TOKEN_BUCKET_LUA)
+            wait_ms = int(await self.script(keys=keys, args=args))
+        except Exception as e:
+            # Fail open: losing Redis should not take the API down with it
+            logger.warning("Rate limiter unavailable", extra={"error": str(e)})
+            return None
+
+        if wait_ms > 0:
+            return self._reject(429, "Too many requests", math.ceil(wait_ms / 1000))
+        return None
+
+    @staticmethod
+    def _reject(status_code, detail, retry_after):
+        return JSONResponse(
+            {"detail": detail},
+            status_code=status_code,
+            headers={"Retry-After": str(max(1, retry_after))},
+        )
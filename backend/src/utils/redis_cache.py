@@ -1,40 +1,72 @@
 # src/utils/redis_cache.py (likely location)
 import redis
+import redis.asyncio
 import json
+import logging
 import os
 from datetime import timedelta
+from src.utils.profiler import span
+
+logger = logging.getLogger(__name__)
 
 # Get Redis connection parameters from environment variables
 redis_host = os.getenv("REDIS_HOST", "localhost")
 redis_port = int(os.getenv("REDIS_PORT", 6379))
 
-# Create Redis client
-redis_client = redis.Redis(
-    host=redis_host,
-    port=redis_port,
-    decode_responses=True  # Automatically decode responses to strings
-)
+# Redis client is created lazily so each worker builds its own pool after fork
+_redis_client = None
+_async_redis_client = None
+
+def get_redis_client():
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis(
+            host=redis_host,
+            port=redis_port,
+            decode_responses=True  # Automatically decode responses to strings
+        )
+    return _redis_client
+
+def get_async_redis_client():
+    # For middleware running on the event loop, where a blocking call would stall every request
+    global _async_redis_client
+    if _async_redis_client is None:
+        _async_redis_client = redis.asyncio.Redis(
+            host=redis_host,
+            port=redis_port,
+            decode_responses=True
+        )
+    return _async_redis_client
+
+def reset_redis_client():
+    # Forget any client inherited from the parent process
+    global _redis_client, _async_redis_client
+    _redis_client = None
+    _async_redis_client = None
 
 def get_cache(key):
     try:
-        data = redis_client.get(key)
+        with span("redis", f"GET {key}"):
+            data = get_redis_client().get(key)
         return data
     except Exception as e:
-        print(f"Redis get error: {e}")
+        logger.warning("Redis get error", extra={"key": key, "error": str(e)})
         return None
 
 def set_cache(key, value, expire_time=timedelta(minutes=30)):
     try:
-        redis_client.set(key, value, ex=int(expire_time.total_seconds()))
+        with span("redis", f"SET {key}"):
+            get_redis_client().set(key, value, ex=int(expire_time.total_seconds()))
         return True
     except Exception as e:
-        print(f"Redis set error: {e}")
+        logger.warning("Redis set error", extra={"key": key, "error": str(e)})
         return False
 
 def delete_cache(key):
     try:
-        redis_client.delete(key)
+        with span("redis", f"DEL {key}"):
+            get_redis_client().delete(key)
         return True
     except Exception as e:
-        print(f"Redis delete error: {e}")
+        logger.warning("Redis delete error", extra={"key": key, "error": str(e)})
         return False
\ No newline at end of file
@@ -0,0 +1,44 @@
+# backend/tests/asgi.py
+"""Helpers for calling the pure-ASGI middleware directly."""
+import asyncio
+
+from jose import jwt
+
+from src.config import settings
+
+
+def auth_cookie(user):
+    token = jwt.encode({"sub": user}, settings.JWT_SECRET_KEY, algorithm="HS256")
+    return (b"cookie", f"token={token}".encode("latin-1"))
+
+
+def make_scope(method, path, headers=(), client_ip="10.0.0.1"):
+    return {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "headers": list(headers),
+        "client": (client_ip, 50000),
+    }
+
+
+async def call(app, scope, body=b""):
+    """Drive an ASGI app once; return (status, headers dict, body)."""
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    start = next(m for m in sent if m["type"] == "http.response.start")
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in start.get("headers", [])}
+    payload = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return start["status"], headers, payload
+
+
+def run(coro):
+    return asyncio.run(coro)
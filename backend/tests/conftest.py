@@ -0,0 +1,28 @@
+# backend/tests/conftest.py
+"""Shared fixtures. Run from ``backend/`` with ``python -m pytest -q``.
+
+Redis is replaced by fakeredis (with Lua), so nothing here needs a running
+server or database.
+"""
+import os
+
+# Settings are required at import time; nothing connects to these
+for name, value in {
+    "DB_USER": "test", "DB_PASSWORD": "test", "DB_NAME": "test", "DB_HOST": "localhost",
+    "DB_PORT": "5432", "JWT_SECRET_KEY": "test-secret", "API_KEY": "test",
+    "REDIS_HOST": "localhost", "REDIS_PORT": "6379",
+}.items():
+    os.environ.setdefault(name, value)
+
+import fakeredis
+import pytest
+
+from src.utils import idempotency, rate_limit
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(rate_limit, "get_async_redis_client", lambda: client)
+    monkeypatch.setattr(idempotency, "get_async_redis_client", lambda: client)
+    return client
@@ -0,0 +1,221 @@
+# backend/tests/test_idempotency.py
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from starlette.responses import JSONResponse
+
+from src.config import settings
+from src.utils import idempotency
+from src.utils.idempotency import IdempotencyMiddleware
+from tests.asgi import auth_cookie, call, make_scope, run
+
+
+class OrderApp:
+    """Stands in for the routes: counts calls and answers with ``status``."""
+
+    def __init__(self, status=201, commit=False):
+        self.status = status
+        self.commit = commit
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        body = (await receive())["body"]
+        if self.commit:
+            # A real commit, so the Session listener marks the request as having written
+            with Session(create_engine("sqlite://")) as session:
+                session.commit()
+        response = JSONResponse({"order": self.calls, "echo": body.decode()}, status_code=self.status,
+                                headers={"set-cookie": "token=leak"})
+        await response(scope, receive, send)
+
+
+def order_scope(key="k1", location=None):
+    headers = [auth_cookie("alice"), (b"idempotency-key", key.encode())]
+    if location:
+        headers.append((b"x-location", location.encode()))
+    return make_scope("POST", "/api/orders", headers)
+
+
+@pytest.fixture
+def short_wait(monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_WAIT_SECONDS", 0.2)
+
+
+def test_duplicate_is_replayed_without_running_the_handler(redis_client):
+    app = OrderApp()
+    middleware = IdempotencyMiddleware(app)
+
+    async def scenario():
+        return await call(middleware, order_scope(), b'{"id": 1}'), await call(middleware, order_scope(), b'{"id": 1}')
+
+    (status, headers, body), (replay_status, replay_headers, replay_body) = run(scenario())
+    assert app.calls == 1
+    assert (replay_status, replay_body) == (status, body) == (201, body)
+    assert replay_headers["idempotent-replayed"] == "true"
+    assert replay_headers["content-type"] == "application/json"
+    assert "set-cookie" not in replay_headers
+
+
+def test_same_key_with_a_different_body_is_rejected(redis_client):
+    app = OrderApp()
+    middleware = IdempotencyMiddleware(app)
+
+    async def scenario():
+        await call(middleware, order_scope(), b'{"id": 1}')
+        return await call(middleware, order_scope(), b'{"id": 2}')
+
+    status, _, _ = run(scenario())
+    assert status == 422
+    assert app.calls == 1
+
+
+def test_same_key_at_another_location_is_a_separate_request(redis_client):
+    app = OrderApp()
+    middleware = IdempotencyMiddleware(app)
+
+    async def scenario():
+        await call(middleware, order_scope(location="north"), b"{}")
+        return await call(middleware, order_scope(location="south"), b"{}")
+
+    status, headers, _ = run(scenario())
+    assert status == 201
+    assert "idempotent-replayed" not in headers
+    assert app.calls == 2
+
+
+def test_requests_without_a_key_or_user_pass_through(redis_client):
+    app = OrderApp()
+    middleware = IdempotencyMiddleware(app)
+    anonymous = make_scope("POST", "/api/orders", [(b"idempotency-key", b"k1")])
+
+    async def scenario():
+        for scope in (anonymous, anonymous, make_scope("POST", "/api/orders", [auth_cookie("alice")])):
+            await call(middleware, scope, b"{}")
+
+    run(scenario())
+    assert app.calls == 3
+    assert run(redis_client.keys("idempotency:*")) == []
+
+
+def test_duplicate_of_an_in_flight_request_times_out_with_409(redis_client, short_wait):
+    middleware = IdempotencyMiddleware(OrderApp())
+    slow = asyncio.Event()
+
+    async def blocking_app(scope, receive, send):
+        await slow.wait()
+        await OrderApp()(scope, receive, send)
+
+    first = IdempotencyMiddleware(blocking_app)
+
+    async def scenario():
+        original = asyncio.create_task(call(first, order_scope(), b"{}"))
+        await asyncio.sleep(0.01)
+        duplicate = await call(middleware, order_scope(), b"{}")
+        slow.set()
+        await original
+        return duplicate
+
+    status, headers, _ = run(scenario())
+    assert status == 409
+    assert headers["retry-after"] == "1"
+
+
+def test_duplicate_waits_for_the_original_response(redis_client):
+    release = asyncio.Event()
+    app = OrderApp()
+
+    async def gated_app(scope, receive, send):
+        await release.wait()
+        await app(scope, receive, send)
+
+    middleware = IdempotencyMiddleware(gated_app)
+
+    async def scenario():
+        original = asyncio.create_task(call(middleware, order_scope(), b"{}"))
+        await asyncio.sleep(0.01)
+        duplicate = asyncio.create_task(call(middleware, order_scope(), b"{}"))
+        await asyncio.sleep(0.1)
+        release.set()
+        return await original, await duplicate
+
+    (status, _, body), (replay_status, replay_headers, replay_body) = run(scenario())
+    assert app.calls == 1
+    assert (replay_status, replay_body) == (status, body)
+    assert replay_headers["idempotent-replayed"] == "true"
+
+
+def test_failure_before_any_commit_releases_the_key(redis_client):
+    failing = OrderApp(status=500)
+    middleware = IdempotencyMiddleware(failing)
+
+    async def scenario():
+        await call(middleware, order_scope(), b"{}")
+        return await redis_client.keys("idempotency:*")
+
+    assert run(scenario()) == []
+
+    # The retry runs the handler again
+    retry = OrderApp()
+    status, _, _ = run(call(IdempotencyMiddleware(retry), order_scope(), b"{}"))
+    assert status == 201
+    assert retry.calls == 1
+
+
+def test_duplicate_told_to_retry_when_the_original_is_released(redis_client, short_wait):
+    release = asyncio.Event()
+
+    async def failing_app(scope, receive, send):
+        await release.wait()
+        await OrderApp(status=500)(scope, receive, send)
+
+    async def scenario():
+        original = asyncio.create_task(call(IdempotencyMiddleware(failing_app), order_scope(), b"{}"))
+        await asyncio.sleep(0.01)
+        duplicate = asyncio.create_task(call(IdempotencyMiddleware(OrderApp()), order_scope(), b"{}"))
+        await asyncio.sleep(0.05)
+        release.set()
+        await original
+        return await duplicate
+
+    status, headers, _ = run(scenario())
+    assert status == 409
+    assert headers["retry-after"] == "1"
+
+
+def test_failure_after_a_commit_is_not_run_again(redis_client):
+    middleware = IdempotencyMiddleware(OrderApp(status=500, commit=True))
+    retry = OrderApp()
+
+    async def scenario():
+        await call(middleware, order_scope(), b"{}")
+        (stored,) = [await redis_client.get(key) for key in await redis_client.keys("idempotency:*")]
+        return json.loads(stored), await call(IdempotencyMiddleware(retry), order_scope(), b"{}")
+
+    stored, (status, headers, _) = run(scenario())
+    assert stored["state"] == "unknown"
+    assert status == 409
+    # Retrying will never help; the client has to look the order up instead
+    assert "retry-after" not in headers
+    assert retry.calls == 0
+
+
+def test_commit_outside_an_idempotent_request_is_ignored():
+    with Session(create_engine("sqlite://")) as session:
+        session.commit()
+    assert idempotency._request_writes.get() is None
+
+
+def test_store_unavailable_runs_the_handler(monkeypatch):
+    def unavailable():
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(idempotency, "get_async_redis_client", unavailable)
+    app = OrderApp()
+    status, _, body = run(call(IdempotencyMiddleware(app), order_scope(), b'{"id": 1}'))
+    assert status == 201
+    # The body already read for the fingerprint is handed on to the route
+    assert json.loads(body)["echo"] == '{"id": 1}'
@@ -0,0 +1,60 @@
+# backend/tests/test_order_partitions.py
+from datetime import date
+
+import pytest
+
+from src.utils.order_partitions import _add_months, ensure_future_partitions, partition_name
+
+
+@pytest.mark.parametrize("start, months, expected", [
+    (date(2026, 1, 1), 0, date(2026, 1, 1)),
+    (date(2026, 1, 1), 1, date(2026, 2, 1)),
+    (date(2026, 11, 1), 1, date(2026, 12, 1)),
+    (date(2026, 12, 1), 1, date(2027, 1, 1)),
+    (date(2026, 11, 1), 14, date(2028, 1, 1)),
+    (date(2026, 1, 1), -1, date(2025, 12, 1)),
+    (date(2026, 3, 1), -15, date(2024, 12, 1)),
+    (date(2026, 12, 1), -12, date(2025, 12, 1)),
+])
+def test_add_months(start, months, expected):
+    assert _add_months(start, months) == expected
+
+
+def test_partition_name_is_zero_padded():
+    assert partition_name(date(2026, 3, 1)) == "orders_2026_03"
+
+
+class RecordingConnection:
+    """Answers the pg_class lookup from ``tables`` and records every other statement."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        if "FROM pg_class" in sql:
+            return [(name, True) for name in self.tables]
+        self.statements.append((sql, params))
+        return []
+
+
+def test_ensure_future_partitions_creates_only_missing_months_across_the_year_end():
+    conn = RecordingConnection(["orders_2026_11", "orders_2027_01"])
+
+    created = ensure_future_partitions(conn, 3, today=date(2026, 11, 19))
+
+    assert created == ["orders_2026_12", "orders_2027_02"]
+    attaches = [sql for sql, _ in conn.statements if "ATTACH PARTITION" in sql]
+    assert "FOR VALUES FROM ('2026-12-01') TO ('2027-01-01')" in attaches[0]
+    assert "FOR VALUES FROM ('2027-02-01') TO ('2027-03-01')" in attaches[1]
+    # Rows that fell into orders_default are moved with the same bounds
+    moves = [params for sql, params in conn.statements if "DELETE FROM orders_default" in sql]
+    assert moves[0] == {"start": date(2026, 12, 1), "end": date(2027, 1, 1)}
+
+
+def test_ensure_future_partitions_is_a_no_op_when_all_months_exist():
+    conn = RecordingConnection(["orders_2026_10", "orders_2026_11"])
+
+    assert ensure_future_partitions(conn, 1, today=date(2026, 10, 31)) == []
+    assert conn.statements == []
@@ -0,0 +1,115 @@
+# backend/tests/test_rate_limit.py
+from src.config import settings
+from src.utils import rate_limit
+from src.utils.rate_limit import TOKEN_BUCKET_LUA, RateLimitMiddleware
+from tests.asgi import auth_cookie, call, make_scope, run
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def test_bucket_admits_up_to_capacity_then_reports_wait(redis_client):
+    async def scenario():
+        script = redis_client.register_script(TOKEN_BUCKET_LUA)
+        admitted = [await script(keys=["b"], args=[3, 1.0]) for _ in range(3)]
+        return admitted, await script(keys=["b"], args=[3, 1.0])
+
+    admitted, wait_ms = run(scenario())
+    assert admitted == [0, 0, 0]
+    # One token at one per second
+    assert 900 < wait_ms <= 1000
+
+
+def test_bucket_consumes_from_all_keys_or_none(redis_client):
+    async def scenario():
+        script = redis_client.register_script(TOKEN_BUCKET_LUA)
+        # "tight" holds a single token; "wide" has plenty
+        first = await script(keys=["wide", "tight"], args=[10, 1.0, 1, 0.01])
+        second = await script(keys=["wide", "tight"], args=[10, 1.0, 1, 0.01])
+        return first, second, float(await redis_client.hget("wide", "t"))
+
+    first, second, wide_tokens = run(scenario())
+    assert first == 0
+    assert second > 0
+    # The rejected call must not have spent a token from the bucket that had room
+    assert 8.9 < wide_tokens < 9.1
+
+
+def test_bucket_reports_the_longest_wait(redis_client):
+    async def scenario():
+        script = redis_client.register_script(TOKEN_BUCKET_LUA)
+        await script(keys=["fast", "slow"], args=[1, 10.0, 1, 0.5])
+        return await script(keys=["fast", "slow"], args=[1, 10.0, 1, 0.5])
+
+    wait_ms = run(scenario())
+    # 0.5 tokens per second: the slow bucket needs ~2s, the fast one ~0.1s
+    assert 1900 < wait_ms <= 2000
+
+
+def test_middleware_returns_429_with_retry_after_in_whole_seconds(redis_client):
+    middleware = RateLimitMiddleware(ok_app)
+    scope = make_scope("POST", "/api/login")
+
+    async def scenario():
+        capacity, _ = rate_limit.RATE_LIMITS["auth"]["ip"]
+        statuses = [(await call(middleware, scope))[0] for _ in range(capacity)]
+        return statuses, await call(middleware, scope)
+
+    statuses, (status, headers, _) = run(scenario())
+    assert set(statuses) == {200}
+    assert status == 429
+    # auth refills 10 tokens a minute: one token is six seconds away
+    assert headers["retry-after"] == "6"
+
+
+def test_middleware_limits_each_user_separately(redis_client, monkeypatch):
+    monkeypatch.setitem(rate_limit.RATE_LIMITS, "orders", {"ip": (100, 1.0), "user": (1, 0.1)})
+    middleware = RateLimitMiddleware(ok_app)
+
+    async def scenario():
+        alice = make_scope("POST", "/api/orders", [auth_cookie("alice")])
+        bob = make_scope("POST", "/api/orders", [auth_cookie("bob")])
+        return [(await call(middleware, scope))[0] for scope in (alice, alice, bob)]
+
+    assert run(scenario()) == [200, 429, 200]
+
+
+def test_token_subject_rejects_forged_tokens():
+    scope = make_scope("GET", "/api/users", [(b"cookie", b"token=not-a-jwt")])
+    assert rate_limit.token_subject(scope) is None
+
+
+def test_middleware_fails_open_without_redis(monkeypatch):
+    def unavailable():
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(rate_limit, "get_async_redis_client", unavailable)
+    status, _, _ = run(call(RateLimitMiddleware(ok_app), make_scope("POST", "/api/login")))
+    assert status == 200
+
+
+def test_middleware_sheds_when_saturated(redis_client, monkeypatch):
+    monkeypatch.setattr(rate_limit, "db_pool_wait_ms", lambda: 0.0)
+    middleware = RateLimitMiddleware(ok_app)
+    middleware.in_flight = settings.MAX_IN_FLIGHT_REQUESTS
+
+    status, headers, _ = run(call(middleware, make_scope("GET", "/api/products")))
+    assert status == 503
+    assert headers["retry-after"] == "1"
+
+
+def test_middleware_sheds_when_the_pool_wait_is_high(redis_client, monkeypatch):
+    monkeypatch.setattr(rate_limit, "db_pool_wait_ms", lambda: settings.DB_POOL_WAIT_SHED_MS + 1)
+    status, _, _ = run(call(RateLimitMiddleware(ok_app), make_scope("GET", "/api/products")))
+    assert status == 503
+
+
+def test_health_check_is_never_limited_or_shed(redis_client, monkeypatch):
+    monkeypatch.setattr(rate_limit, "db_pool_wait_ms", lambda: settings.DB_POOL_WAIT_SHED_MS + 1)
+    middleware = RateLimitMiddleware(ok_app)
+    middleware.in_flight = settings.MAX_IN_FLIGHT_REQUESTS
+
+    status, _, _ = run(call(middleware, make_scope("GET", "/api/healthy")))
+    assert status == 200